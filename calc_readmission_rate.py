@@ -1,15 +1,17 @@
 import duckdb
+import sys
+from readmission_engine import readmission_cube_query
 
-def calculate_and_insert_readmission_rate():
-    query = """
-    INSERT OR REPLACE INTO readmission_rate (year, SP_STATE_CODE, BENE_SEX_IDENT_CD, readmissions, total_admissions, readmission_rate)
+# The original query, with a LAG window here and another one in
+# all_cause_readmission. Only used to check the engine against it.
+legacy_readmission_rate_query = """
     WITH valid_claims AS (
         SELECT 
             ic.CLM_ID,
             ic.DESYNPUF_ID,
             ic.CLM_ADMSN_DT,
             EXTRACT(YEAR FROM ic.CLM_ADMSN_DT) AS year,
-            LAG(ic.NCH_BENE_DSCHRG_DT) OVER (PARTITION BY ic.DESYNPUF_ID ORDER BY ic.CLM_ADMSN_DT) AS prev_discharge_date
+            LAG(ic.NCH_BENE_DSCHRG_DT) OVER (PARTITION BY ic.DESYNPUF_ID ORDER BY ic.CLM_ADMSN_DT, ic.CLM_ID, ic.SEGMENT) AS prev_discharge_date
         FROM 
             inpatient_claims ic
         WHERE 
@@ -49,37 +51,96 @@ def calculate_and_insert_readmission_rate():
         vc.year, bs.SP_STATE_CODE, bs.BENE_SEX_IDENT_CD
     ORDER BY
         vc.year, bs.SP_STATE_CODE, bs.BENE_SEX_IDENT_CD
-    """
-    conn.execute(query)
-    conn.commit()
+"""
 
-# Connect to the existing DuckDB database
-conn = duckdb.connect('claims.duckdb')
-print("Successfully connected to the database.")
+def calculate_and_insert_readmission_rate(conn):
+    # Replace the whole cube, so groups that no longer have admissions go away
+    conn.begin()
+    try:
+        conn.execute("DELETE FROM readmission_rate")
+        conn.execute(f"""
+        INSERT INTO readmission_rate (year, SP_STATE_CODE, BENE_SEX_IDENT_CD, readmissions, total_admissions, age_grp_id, condition_type_id, readmission_rate)
+        {readmission_cube_query}
+        ORDER BY year, SP_STATE_CODE, BENE_SEX_IDENT_CD, age_grp_id, condition_type_id
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-try:
-    # Calculate and insert readmission rates for all years at once
-    print("Calculating and inserting readmission rates for all years...")
-    calculate_and_insert_readmission_rate()
-    print("Readmission rates for all years have been calculated and inserted into the readmission_rate table.")
+def check_parity(conn):
+    # Compare the engine's all-ages, all-conditions rows with the original
+    # query's. Returns True if they match.
+    print("Checking the readmission engine against the original query...")
+    counts = conn.execute(f"""
+        WITH engine AS (
+            SELECT year, SP_STATE_CODE, BENE_SEX_IDENT_CD, readmissions, total_admissions, readmission_rate
+            FROM ({readmission_cube_query})
+            WHERE age_grp_id = 0 AND condition_type_id = 0
+        ),
+        legacy AS ({legacy_readmission_rate_query})
+        SELECT
+            (SELECT COUNT(*) FROM (SELECT * FROM engine EXCEPT ALL SELECT * FROM legacy)),
+            (SELECT COUNT(*) FROM (SELECT * FROM legacy EXCEPT ALL SELECT * FROM engine)),
+            (SELECT COUNT(*) FROM legacy)
+    """).fetchone()
+    engine_only, legacy_only, legacy_rows = counts
+    if engine_only or legacy_only:
+        print(f"Parity check failed: {engine_only} rows only from the engine, {legacy_only} rows only from the original query")
+        return False
+    print(f"Parity check passed: all {legacy_rows} rows match.")
+    return True
 
-    # Verify the inserted data
-    print("\nVerifying inserted data:")
-    verification_query = """
-    SELECT year, SP_STATE_CODE, BENE_SEX_IDENT_CD, readmissions, total_admissions, readmission_rate
-    FROM readmission_rate
-    ORDER BY year, SP_STATE_CODE, BENE_SEX_IDENT_CD
-    LIMIT 10
-    """
-    verification_results = conn.execute(verification_query).fetchall()
-    print("Year | State | Gender | Readmissions | Total Admissions | Readmission Rate")
-    print("-" * 75)
-    for row in verification_results:
-        print(f"{row[0]:4} | {row[1]:5} | {row[2]:6} | {row[3]:12} | {row[4]:16} | {row[5]:.2%}")
+def run(conn):
+    try:
+        # Calculate and insert readmission rates for all years at once
+        print("Calculating and inserting readmission rates for all years...")
+        calculate_and_insert_readmission_rate(conn)
+        print("Readmission rates for all years have been calculated and inserted into the readmission_rate table.")
 
-except Exception as e:
-    print(f"An error occurred: {str(e)}")
+        # Verify the inserted data
+        print("\nVerifying inserted data:")
+        verification_query = """
+        SELECT year, SP_STATE_CODE, BENE_SEX_IDENT_CD, readmissions, total_admissions, readmission_rate
+        FROM readmission_rate
+        WHERE age_grp_id = 0 AND condition_type_id = 0
+        ORDER BY year, SP_STATE_CODE, BENE_SEX_IDENT_CD
+        LIMIT 10
+        """
+        verification_results = conn.execute(verification_query).fetchall()
+        print("Year | State | Gender | Readmissions | Total Admissions | Readmission Rate")
+        print("-" * 75)
+        for row in verification_results:
+            print(f"{row[0]:4} | {row[1]:5} | {row[2]:6} | {row[3]:12} | {row[4]:16} | {row[5]:.2%}")
 
-# Close the database connection
-conn.close()
-print("\nDatabase connection closed.")
+        print("\nReadmission rates by condition, all years, states, sexes and ages:")
+        condition_results = conn.execute("""
+        SELECT c.condition_type_nm, SUM(rr.readmissions), SUM(rr.total_admissions), COUNT(*)
+        FROM readmission_rate rr
+        JOIN conditions c ON rr.condition_type_id = c.condition_type_id
+        WHERE rr.age_grp_id = 0
+        GROUP BY c.condition_type_id, c.condition_type_nm
+        ORDER BY c.condition_type_id
+        """).fetchall()
+        for condition, readmissions, total_admissions, row_count in condition_results:
+            print(f"{condition[:45]:45} | {readmissions:6} / {total_admissions:6} | {readmissions / total_admissions:.2%} ({row_count} rows)")
+
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    # Connect to the existing DuckDB database
+    conn = duckdb.connect('claims.duckdb')
+    print("Successfully connected to the database.")
+    try:
+        if '--check-parity' in sys.argv:
+            # all_cause_readmission must be up to date for the original query
+            if not check_parity(conn):
+                sys.exit(1)
+        else:
+            run(conn)
+    finally:
+        # Close the database connection
+        conn.close()
+        print("\nDatabase connection closed.")
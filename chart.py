@@ -1,6 +1,8 @@
 from __future__ import (absolute_import, division, print_function)
 
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # only writes PNG files, possibly from a pipeline worker thread
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap as Basemap
 from matplotlib.colors import rgb2hex, Normalize
@@ -8,22 +10,23 @@ from matplotlib.patches import Polygon
 from matplotlib.colorbar import ColorbarBase
 import duckdb
 
-def get_readmission_rates():
-    with duckdb.connect('claims.duckdb', read_only=True) as conn:
-        query = """
-        SELECT 
-            s.state_name,
-            ROUND(CAST(SUM(rr.readmissions) AS FLOAT) / NULLIF(SUM(rr.total_admissions), 0) * 100, 2) AS readmission_rate
-        FROM 
-            readmission_rate rr
-        JOIN 
-            state s ON rr.SP_STATE_CODE = s.sp_state_code
-        GROUP BY 
-            s.state_name
-        ORDER BY 
-            readmission_rate DESC
-        """
-        result = conn.execute(query).fetchall()
+def get_readmission_rates(conn):
+    query = """
+    SELECT 
+        s.state_name,
+        ROUND(CAST(SUM(rr.readmissions) AS FLOAT) / NULLIF(SUM(rr.total_admissions), 0) * 100, 2) AS readmission_rate
+    FROM 
+        readmission_rate rr
+    JOIN 
+        state s ON rr.SP_STATE_CODE = s.sp_state_code
+    WHERE
+        rr.age_grp_id = 0 AND rr.condition_type_id = 0
+    GROUP BY 
+        s.state_name
+    ORDER BY 
+        readmission_rate DESC
+    """
+    result = conn.execute(query).fetchall()
     return result
 
 def draw_map(readmission_rates):
@@ -136,8 +139,8 @@ def draw_column_chart(readmission_rates):
     plt.tight_layout()
     return fig
 
-if __name__ == "__main__":
-    readmission_rates = get_readmission_rates()
+def run(conn):
+    readmission_rates = get_readmission_rates(conn)
     #print("Readmission rates:", readmission_rates)
     
     # Create and save the map
@@ -148,3 +151,8 @@ if __name__ == "__main__":
     # Create and save the column chart
     chart_fig = draw_column_chart(readmission_rates)
     chart_fig.savefig('us_col_chart.png', dpi=300, bbox_inches='tight')
+    plt.close(chart_fig)
+
+if __name__ == "__main__":
+    with duckdb.connect('claims.duckdb', read_only=True) as conn:
+        run(conn)
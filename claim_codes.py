@@ -0,0 +1,151 @@
+import duckdb
+import sys
+from csv_loader import ddl_column_types
+from clinical_rules import exclusion_rules
+from incremental import stage_changed_beneficiaries, mark_refreshed
+
+# claim_codes holds the diagnosis, procedure and HCPCS codes of inpatient_claims
+# in long format, one row per code with its type and column position.
+# "Claims with any of these codes" becomes a filter on the code column plus a
+# semi-join on CLM_ID, instead of an OR across every code column. The table is
+# sorted by code type and code, so the zone maps of a full build let such a
+# filter skip the row groups outside the requested code ranges.
+
+# code_type -> column name prefix in inpatient_claims
+code_types = {
+    'ICD9_DX': 'ICD9_DGNS_CD_',
+    'ICD9_PRCDR': 'ICD9_PRCDR_CD_',
+    'HCPCS': 'HCPCS_CD_',
+}
+
+# Code column of inpatient_claims -> (code_type, position)
+code_columns = {
+    column: (code_type, int(column[len(prefix):]))
+    for column in ddl_column_types('sql/inpatient_claims.sql')
+    for code_type, prefix in code_types.items()
+    if column.startswith(prefix) and column[len(prefix):].isdigit()
+}
+
+def codes_query(bene_filter=''):
+    # Unpivot the code columns of the claims matching bene_filter (a WHERE clause).
+    # Empty code columns are NULL and UNPIVOT leaves them out.
+    columns = ', '.join(code_columns)
+    code_type_case = ' '.join(
+        f"WHEN code_column LIKE '{prefix}%' THEN '{code_type}'" for code_type, prefix in code_types.items()
+    )
+    return f"""
+        SELECT
+            DESYNPUF_ID,
+            CLM_ID,
+            SEGMENT,
+            CASE {code_type_case} END AS code_type,
+            CAST(regexp_extract(code_column, '_([0-9]+)$', 1) AS INTEGER) AS position,
+            code
+        FROM (
+            UNPIVOT (SELECT DESYNPUF_ID, CLM_ID, SEGMENT, {columns} FROM inpatient_claims {bene_filter})
+            ON {columns}
+            INTO NAME code_column VALUE code
+        )
+        ORDER BY code_type, code, CLM_ID
+    """
+
+def prefix_range(prefix, column='code'):
+    # column LIKE 'V42%' as a range the zone maps can use
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return f"({column} >= '{prefix}' AND {column} < '{upper}')"
+
+def matching_claims_query(code_type, codes=(), prefixes=(), positions=None):
+    # SELECT of the claim rows with any of the given codes or code prefixes,
+    # optionally only in the given positions, for use as a semi-join:
+    #   WHERE (CLM_ID, SEGMENT) IN (matching_claims_query(...))
+    conditions = []
+    if codes:
+        conditions.append(f"code IN ({', '.join(repr(code) for code in codes)})")
+    conditions.extend(prefix_range(prefix) for prefix in prefixes)
+    position_filter = f"AND position IN ({', '.join(str(p) for p in positions)})" if positions else ""
+    return f"""
+        SELECT DISTINCT CLM_ID, SEGMENT
+        FROM claim_codes
+        WHERE code_type = '{code_type}'
+          AND ({' OR '.join(conditions) or 'false'})
+          {position_filter}
+    """
+
+def rule_claims_query(rule):
+    # Claim rows matching a rule of clinical_rules.py, found through claim_codes
+    code_type, = {code_columns[column][0] for column in rule['columns']}
+    positions = [code_columns[column][1] for column in rule['columns']]
+    return matching_claims_query(code_type, rule['codes'], rule['prefixes'], positions)
+
+def check_rule_flags(conn):
+    # The claims matching each clinical rule in claim_codes should be exactly
+    # the claims whose flag is set on inpatient_claims
+    for flag, rule in exclusion_rules.items():
+        flagged_only, codes_only = conn.execute(f"""
+            WITH flagged AS (SELECT CLM_ID, SEGMENT FROM inpatient_claims WHERE {flag}),
+            matched AS ({rule_claims_query(rule)})
+            SELECT
+                (SELECT COUNT(*) FROM (SELECT * FROM flagged EXCEPT SELECT * FROM matched)),
+                (SELECT COUNT(*) FROM (SELECT * FROM matched EXCEPT SELECT * FROM flagged))
+        """).fetchone()
+        if flagged_only or codes_only:
+            raise RuntimeError(
+                f"{flag} doesn't match claim_codes: {flagged_only} claims only flagged, "
+                f"{codes_only} claims only matched in claim_codes"
+            )
+    print(f"Checked {len(exclusion_rules)} clinical rules against claim_codes.")
+
+def refresh_claim_codes(conn, full_refresh=False):
+    # Rebuild claim_codes, or replace the codes of just the beneficiaries whose
+    # claims changed since the last refresh. A full rebuild sorts the whole
+    # table; incremental refreshes append their rows sorted among themselves.
+    bene_count, newest_change = stage_changed_beneficiaries(conn, 'claim_codes')
+    full_refresh = full_refresh or conn.execute(
+        "SELECT target FROM refresh_log WHERE target = 'claim_codes'"
+    ).fetchone() is None
+
+    conn.begin()
+    try:
+        if full_refresh:
+            print("Building the claim_codes table...")
+            conn.execute("DELETE FROM claim_codes")
+            conn.execute(f"INSERT INTO claim_codes {codes_query()}")
+        elif bene_count == 0:
+            print("No claims changed since the last refresh.")
+        else:
+            print(f"Refreshing claim_codes for {bene_count} beneficiaries with changed claims...")
+            conn.execute("DELETE FROM claim_codes WHERE DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)")
+            conn.execute(f"""
+                INSERT INTO claim_codes
+                {codes_query('WHERE DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)')}
+            """)
+        mark_refreshed(conn, 'claim_codes', newest_change)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def run(conn, full_refresh=False):
+    table_check = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='claim_codes'").fetchone()
+    if not table_check:
+        raise RuntimeError("The claim_codes table does not exist. Please run create_claims_db.py first.")
+
+    refresh_claim_codes(conn, full_refresh)
+    check_rule_flags(conn)
+
+    print("\nCodes per code type:")
+    for code_type, code_count, claim_count in conn.execute("""
+        SELECT code_type, COUNT(*), COUNT(DISTINCT CLM_ID)
+        FROM claim_codes
+        GROUP BY code_type
+        ORDER BY code_type
+    """).fetchall():
+        print(f"{code_type:10} | {code_count:10} codes | {claim_count:8} claims")
+
+if __name__ == "__main__":
+    conn = duckdb.connect('claims.duckdb')
+    try:
+        run(conn, full_refresh='--full' in sys.argv)
+    finally:
+        conn.close()
+        print("Database connection closed.")
@@ -0,0 +1,122 @@
+from incremental import log_changed_beneficiaries
+
+# Clinical exclusion rules for readmissions.
+# Each rule is stored on inpatient_claims as a BOOLEAN flag column, computed
+# once when the claims are loaded. Queries test the flag instead of matching
+# diagnosis codes on every run.
+# A flag is NULL when the codes it checks are missing and none of them match,
+# the same as the IN / LIKE conditions it replaces, so NOT FLAG filters out
+# those claims just like the original conditions did.
+
+diagnosis_columns = [f'ICD9_DGNS_CD_{n}' for n in range(1, 10)]
+
+# Flag column -> the diagnosis columns checked, and the exact codes and code
+# prefixes that set the flag
+exclusion_rules = {
+    # Psychiatric admissions
+    'PSYCH_FLAG': {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': [],
+        'prefixes': ['29', '30', '31'],
+    },
+    # Rehabilitation admissions
+    'REHAB_FLAG': {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': ['V57'],
+        'prefixes': [],
+    },
+    # Left against medical advice, on any diagnosis
+    'AMA_FLAG': {
+        'columns': diagnosis_columns,
+        'codes': ['V642'],
+        'prefixes': [],
+    },
+    # Planned readmissions (transplants)
+    'TRANSPLANT_FLAG': {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': [
+            '5280', '5281', '5282',  # Pancreas transplant
+            '3751',  # Heart transplant
+            '3350', '3351', '3352',  # Lung transplant
+            '4697',  # Intestine transplant
+            '4100', '4101', '4102', '4103', '4104', '4105', '4106', '4107', '4108', '4109',  # Bone marrow transplant
+            '5561', '5569',  # Kidney transplant
+            '5051', '5059',  # Liver transplant
+        ],
+        'prefixes': ['V42'],  # Organ replacements
+    },
+}
+
+def flag_expression(rule):
+    # SQL expression for a rule: any of its columns has one of its codes or prefixes
+    conditions = []
+    for column in rule['columns']:
+        if rule['codes']:
+            conditions.append(f"{column} IN ({', '.join(repr(code) for code in rule['codes'])})")
+        conditions.extend(f"{column} LIKE '{prefix}%'" for prefix in rule['prefixes'])
+    return '(' + ' OR '.join(conditions) + ')'
+
+def flag_expressions():
+    # Flag column -> SQL expression, for computing the flags while loading
+    return {flag: flag_expression(rule) for flag, rule in exclusion_rules.items()}
+
+def refresh_flags(conn):
+    # Recompute the flags of the claims whose stored flags don't match the
+    # rules, e.g. claims loaded before the flags existed or after a rule changed.
+    # Their beneficiaries go to bene_change_log, like loaded rows do.
+    expressions = flag_expressions()
+    assignments = ', '.join(f"{flag} = {expr}" for flag, expr in expressions.items())
+    mismatches = ' OR '.join(f"{flag} IS DISTINCT FROM {expr}" for flag, expr in expressions.items())
+    conn.begin()
+    try:
+        log_changed_beneficiaries(conn, 'inpatient_claims', f"WHERE {mismatches}")
+        updated = conn.execute(f"UPDATE inpatient_claims SET {assignments} WHERE {mismatches}").fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if updated:
+        print(f"Updated the clinical exclusion flags of {updated} claims")
+    return updated
+
+# Readmission condition cohorts of the conditions table (sql/conditions.sql)
+# by principal diagnosis, in the same form as the exclusion rules.
+# condition_type_id -> rule
+condition_rules = {
+    # Acute myocardial infarction, initial episode of care (410.x0, 410.x1)
+    11: {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': [f'410{site}{episode}' for site in range(10) for episode in (0, 1)],
+        'prefixes': [],
+    },
+    # Chronic obstructive pulmonary disease
+    22: {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': ['49121', '49122', '4918', '4919', '4928', '49320', '49321', '49322', '496'],
+        'prefixes': [],
+    },
+    # Heart failure, including hypertensive heart (and kidney) disease with heart failure
+    33: {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': ['40201', '40211', '40291', '40401', '40403', '40411', '40413', '40491', '40493'],
+        'prefixes': ['428'],
+    },
+    # Pneumonia, including influenza with pneumonia
+    44: {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': ['4870', '48811'],
+        'prefixes': ['480', '481', '482', '483', '485', '486'],
+    },
+    # Sepsis and septicemia
+    77: {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': ['99591', '99592', '78552'],
+        'prefixes': ['038'],
+    },
+    # Chronic kidney disease and end-stage renal disease
+    88: {
+        'columns': ['ICD9_DGNS_CD_1'],
+        'codes': [],
+        'prefixes': ['403', '585', '586'],
+    },
+}
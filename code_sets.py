@@ -0,0 +1,120 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from result_cache import normalize_sql
+from sql_guard import parse_select, find_nodes, sql_literal
+
+# Code sets of the dashboard's generated SQL.
+# Generated SQL that only filters the claims on their diagnosis code is
+# resolved once into the set of matching ICD-10 codes: its WHERE clause runs
+# over the ~75k codes of icd10_hierarchy and the distinct codes of the claims
+# instead of over every claim, and the code numbers are stored under a set id
+# in code_set_codes. The claims are then a hash semi-join of
+# inpatient_claims_icd10 against the set (an IN subquery), and the code table
+# reads the set too, so paging and re-rendering never evaluate the generated
+# LIKE chain against the claims again.
+# The sets live in an in-memory database attached to the dashboard's read-only
+# connection, shared by its cursors. Sets are keyed by the normalized WHERE
+# clause and the data version, so sessions asking the same question share one,
+# and beyond max_sets the least recently used sets are dropped.
+
+# Columns a code-only filter may use: the code and its number (see icd10_hierarchy.py)
+code_columns = {'icd10_dgns_code', 'icd10_dgns_num'}
+
+class CodeSets:
+    def __init__(self, claims_table, max_sets=256):
+        self.claims_table = claims_table
+        self.max_sets = max_sets
+        self.lock = threading.Lock()
+        self.sets = OrderedDict()  # (WHERE clause, table alias, data version) -> set id
+
+    def attach(self, conn):
+        # on_connect of the connection pool: a new connection, so no sets yet
+        conn.execute("ATTACH ':memory:' AS code_sets (READ_WRITE)")
+        conn.execute("CREATE TABLE code_sets.code_set_codes (set_id VARCHAR, code_num BIGINT)")
+        with self.lock:
+            self.sets.clear()
+
+    def code_filter(self, conn, sql):
+        # WHERE clause of sql and the name it gives the claims table, when sql
+        # is SELECT * from the claims table with a WHERE clause on the
+        # diagnosis code only, else None
+        parsed = parse_select(conn, sql)
+        if parsed['error'] or len(parsed['statements']) != 1:
+            return None
+        node = parsed['statements'][0]['node']
+        if (node['type'] != 'SELECT_NODE' or node['modifiers'] or node['cte_map']['map']
+                or node['group_expressions'] or node['having'] or node['qualify'] or node['sample']
+                or node['where_clause'] is None):
+            return None
+        if [item['type'] for item in node['select_list']] != ['STAR'] or node['select_list'][0]['exclude_list']:
+            return None
+        table = node['from_table']
+        if table['type'] != 'BASE_TABLE' or table['table_name'].lower() != self.claims_table.lower():
+            return None
+        where = node['where_clause']
+        # The codes have no NULL code, unlike the claims
+        if any(True for _ in find_nodes(where, ('SUBQUERY', 'OPERATOR_IS_NULL', 'OPERATOR_IS_NOT_NULL'))):
+            return None
+        if any(column['column_names'][-1].lower() not in code_columns
+               for column in find_nodes(where, ('COLUMN_REF',))):
+            return None
+        where_clause = re.search(r"\bwhere\b(.+)$", sql, re.IGNORECASE | re.DOTALL).group(1).strip()
+        return where_clause, table['alias'] or table['table_name']
+
+    def resolve(self, conn, sql, data_version):
+        # Set id of the codes sql filters on, or None when it filters on more
+        code_filter = self.code_filter(conn, sql)
+        if code_filter is None:
+            return None
+        where, alias = code_filter
+        key = (normalize_sql(where), alias, data_version)
+        with self.lock:
+            set_id = self.sets.get(key)
+            if set_id is not None:
+                self.sets.move_to_end(key)
+                return set_id
+            set_id = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:16]
+            # The codes under the names and alias of the claims columns, so
+            # the generated WHERE clause applies to them unchanged. The claims
+            # may carry codes the hierarchy doesn't have (e.g. NoDx), which
+            # are in the set when the filter matches them too.
+            conn.execute(f"""
+                INSERT INTO code_sets.code_set_codes
+                SELECT '{set_id}', ICD10_DGNS_NUM
+                FROM (SELECT icd10_cm_code AS ICD10_DGNS_CODE, code_num AS ICD10_DGNS_NUM
+                      FROM icd10_hierarchy
+                      UNION
+                      SELECT DISTINCT ICD10_DGNS_CODE, ICD10_DGNS_NUM
+                      FROM {self.claims_table}
+                      WHERE ICD10_DGNS_CODE IS NOT NULL) AS "{alias.replace('"', '""')}"
+                WHERE {where}
+            """)
+            self.sets[key] = set_id
+            while len(self.sets) > self.max_sets:
+                _, evicted = self.sets.popitem(last=False)
+                conn.execute("DELETE FROM code_sets.code_set_codes WHERE set_id = ?", [evicted])
+            return set_id
+
+    def stored(self, set_id, data_version):
+        # Whether set_id is one of this connection's sets, for data_version
+        with self.lock:
+            return any(stored_id == set_id and key[2] == data_version for key, stored_id in self.sets.items())
+
+    def claims_query(self, set_id, set_id_sql=None):
+        # Claims with a code of the set. set_id_sql replaces the set id
+        # literal, e.g. with a bound parameter.
+        return f"""SELECT c.* FROM {self.claims_table} AS c
+            WHERE c.ICD10_DGNS_NUM IN (SELECT code_num FROM code_sets.code_set_codes
+                                       WHERE set_id = {set_id_sql or sql_literal(set_id)})"""
+
+    def codes_query(self):
+        # Codes of a set with a description, for the code table. The set id
+        # is its parameter.
+        return """SELECT h.icd10_cm_code, h.description FROM icd10_hierarchy AS h
+            SEMI JOIN code_sets.code_set_codes AS s
+            ON h.code_num = s.code_num AND s.set_id = ?
+            WHERE h.description IS NOT NULL
+            ORDER BY h.icd10_cm_code"""
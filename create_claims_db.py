@@ -13,9 +13,7 @@ def execute_sql(conn, sql, table_name):
         print(f"{table_name} table created successfully. Current row count: {row_count}")
     except Exception as e:
         print(f"Error creating {table_name} table: {str(e)}")
-
-# Create a connection to a new or existing DuckDB database file
-conn = duckdb.connect('claims.duckdb')
+        raise
 
 # SQL file paths
 sql_files = {
@@ -23,15 +21,29 @@ sql_files = {
     'inpatient_claims': 'sql/inpatient_claims.sql',
     'readmission_rate': 'sql/readmission_rate.sql',
     'state':'sql/state.sql',
-    'gender':'sql/gender.sql'
+    'gender':'sql/gender.sql',
+    'load_manifest':'sql/load_manifest.sql',
+    'bene_change_log':'sql/bene_change_log.sql',
+    'refresh_log':'sql/refresh_log.sql',
+    'pipeline_runs':'sql/pipeline_runs.sql',
+    'claim_codes':'sql/claim_codes.sql',
+    'age_grp':'sql/age_grp.sql',
+    'conditions':'sql/conditions.sql'
 }
 
-# Execute SQL from files
-for table_name, file_path in sql_files.items():
-    sql = read_sql_file(file_path)
-    execute_sql(conn, sql, table_name)
+def run(conn):
+    # Execute SQL from files
+    for table_name, file_path in sql_files.items():
+        sql = read_sql_file(file_path)
+        execute_sql(conn, sql, table_name)
 
-# Close the connection
-conn.close()
+if __name__ == "__main__":
+    # Create a connection to a new or existing DuckDB database file
+    conn = duckdb.connect('claims.duckdb')
+    try:
+        run(conn)
+    finally:
+        # Close the connection
+        conn.close()
 
-print("Database creation completed.")
+    print("Database creation completed.")
@@ -0,0 +1,308 @@
+import os
+import re
+import shutil
+import time
+import zlib
+import zipfile
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from incremental import log_changed_beneficiaries
+
+# Shared helpers for loading the SynPUF CSV files into DuckDB.
+# Every loaded file is recorded in load_manifest (name, size, CRC-32, load time),
+# and every row carries the SOURCE_FILE it came from, so a re-run only loads
+# new or changed files and only deletes the rows of the files it replaces.
+# Column types are taken from the table DDL in sql/, so the CSV parser produces
+# typed columns in one pass instead of sniffing the files and casting afterwards.
+# CSV columns the DDL doesn't define (e.g. PPPYMT_CAR in the beneficiary files)
+# are dropped while reading.
+# The beneficiaries of deleted and inserted rows go to bene_change_log, so
+# derived tables can be refreshed for just those beneficiaries.
+
+DATE_FORMAT = '%Y%m%d'
+
+def ddl_column_types(ddl_path):
+    # Column name -> SQL type from the CREATE TABLE statement in a sql/ file
+    with open(ddl_path, 'r') as file:
+        ddl = re.sub(r'--.*', '', file.read())
+
+    # Split the column list on the commas that aren't inside DECIMAL(10, 2)
+    definitions, current, depth = [], '', 0
+    for ch in ddl[ddl.index('(') + 1:]:
+        if ch == ')' and depth == 0:
+            break
+        depth += {'(': 1, ')': -1}.get(ch, 0)
+        if ch == ',' and depth == 0:
+            definitions.append(current)
+            current = ''
+        else:
+            current += ch
+    definitions.append(current)
+
+    column_types = {}
+    for definition in definitions:
+        match = re.match(r'\s*(\w+)\s+(\w+\s*(?:\([^)]*\))?)', definition)
+        if match and match.group(1).upper() not in ('PRIMARY', 'UNIQUE', 'CHECK', 'FOREIGN', 'CONSTRAINT'):
+            column_types[match.group(1)] = re.sub(r'\s+', '', match.group(2)).upper()
+    return column_types
+
+def extra_columns(column_types, column_names):
+    # CSV columns that aren't in the table definition
+    return [name for name in column_names if name not in column_types]
+
+def read_types(column_types, column_names):
+    # DuckDB read_csv types for the CSV columns. CHAR(n)/VARCHAR(n) are read as
+    # plain VARCHAR; the length is only checked on insert. Columns that aren't
+    # in the table definition are read as VARCHAR, to be dropped.
+    types = {}
+    for name in column_names:
+        sql_type = column_types.get(name, 'VARCHAR')
+        types[name] = 'VARCHAR' if sql_type.startswith(('CHAR', 'VARCHAR')) else sql_type
+    return types
+
+def arrow_types(column_types, column_names):
+    # Arrow types for the CSV columns of the table. Dates are parsed as
+    # timestamps with DATE_FORMAT (Arrow can't parse a date32 in that format)
+    # and are cast to DATE by the insert.
+    types = {}
+    table_columns = [name for name in column_names if name in column_types]
+    for name, sql_type in read_types(column_types, table_columns).items():
+        decimal = re.match(r'DECIMAL\((\d+),(\d+)\)', sql_type)
+        if decimal:
+            types[name] = pa.decimal128(int(decimal.group(1)), int(decimal.group(2)))
+        elif sql_type == 'DATE':
+            types[name] = pa.timestamp('s')
+        elif sql_type == 'INTEGER':
+            types[name] = pa.int32()
+        elif sql_type == 'BIGINT':
+            types[name] = pa.int64()
+        elif sql_type in ('FLOAT', 'DOUBLE'):
+            types[name] = pa.float64()
+        else:
+            types[name] = pa.string()
+    return types
+
+def read_csv_header(f):
+    header = f.readline().decode('utf-8').strip()
+    return [name.strip().strip('"') for name in header.split(',')]
+
+def file_checksum(file_path):
+    # CRC-32 of a file on disk, the same checksum zip stores for its members
+    crc = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            crc = zlib.crc32(chunk, crc)
+    return f"{crc:08x}"
+
+def zip_sources(zip_ref):
+    # Size and checksum of each CSV member come from the zip directory,
+    # so nothing has to be decompressed to tell whether a member changed
+    return [
+        {'source_file': info.filename, 'file_size': info.file_size, 'checksum': f"{info.CRC:08x}"}
+        for info in zip_ref.infolist() if info.filename.endswith('.csv')
+    ]
+
+def disk_sources(file_paths):
+    return [
+        {'source_file': os.path.basename(path), 'path': path,
+         'file_size': os.path.getsize(path), 'checksum': file_checksum(path)}
+        for path in file_paths
+    ]
+
+def changed_sources(conn, table_name, sources):
+    # Keep only the files that are new or whose size or checksum differs from the manifest
+    loaded = {
+        row[0]: (row[1], row[2])
+        for row in conn.execute(
+            "SELECT source_file, file_size, checksum FROM load_manifest WHERE table_name = ?",
+            [table_name]
+        ).fetchall()
+    }
+    return [s for s in sources if loaded.get(s['source_file']) != (s['file_size'], s['checksum'])]
+
+def open_zip_member(zip_ref, member, column_types):
+    # Stream a CSV member of the zip as typed Arrow record batches.
+    # Only the header line is read up front to get the column order.
+    with zip_ref.open(member) as f:
+        column_names = read_csv_header(f)
+    extra = extra_columns(column_types, column_names)
+    if extra:
+        print(f"Dropping columns of {member} that aren't in the table: {', '.join(extra)}")
+    types = arrow_types(column_types, column_names)
+    return pacsv.open_csv(
+        zip_ref.open(member),
+        read_options=pacsv.ReadOptions(use_threads=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types=types,
+            include_columns=list(types),
+            timestamp_parsers=[DATE_FORMAT],
+            strings_can_be_null=True
+        )
+    )
+
+def zip_batch_reader(zip_ref, members, column_types):
+    # Chain the CSV members of the zip into a single record batch reader,
+    # so all of them can go into the table with one INSERT.
+    # Each batch gets a SOURCE_FILE column with the name of its member.
+    first_reader = open_zip_member(zip_ref, members[0], column_types)
+    schema = first_reader.schema.append(pa.field('SOURCE_FILE', pa.string()))
+
+    def batches():
+        for member in members:
+            reader = first_reader if member == members[0] else open_zip_member(zip_ref, member, column_types)
+            if not reader.schema.equals(first_reader.schema):
+                raise ValueError(f"{member} does not have the same columns as {members[0]}")
+            print(f"Streaming {member}")
+            for batch in reader:
+                source_file = pa.array([member] * batch.num_rows, pa.string())
+                yield pa.RecordBatch.from_arrays(batch.columns + [source_file], schema=schema)
+
+    return pa.RecordBatchReader.from_batches(schema, batches())
+
+def bulk_insert(conn, table_name, source, order_by=None, derived_columns=None):
+    # Load every source file with a single INSERT, so DuckDB can scan the files
+    # in parallel and sort (if at all) once over the whole table.
+    # Columns are matched by name, so the source columns already carry the
+    # table types and nothing has to be cast here.
+    # derived_columns: column name -> SQL expression over the source columns,
+    # for table columns computed while loading
+    order_clause = f"ORDER BY {order_by}" if order_by else ""
+    derived = ''.join(f", {expr} AS {name}" for name, expr in (derived_columns or {}).items())
+    start = time.perf_counter()
+    row_count = conn.execute(f"""
+        INSERT INTO {table_name} BY NAME
+        SELECT *{derived}
+        FROM {source}
+        {order_clause}
+    """).fetchone()[0]
+    elapsed = time.perf_counter() - start
+    rows_per_sec = row_count / elapsed if elapsed > 0 else 0
+    print(f"Loaded {row_count} rows into {table_name} in {elapsed:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+    return row_count
+
+def sync_table(conn, table_name, sources, insert_changed, full_reload=False):
+    # Replace the rows of new or changed source files in one transaction and
+    # record them in the manifest. insert_changed(changed) loads the given sources.
+    conn.begin()
+    try:
+        has_manifest = conn.execute(
+            "SELECT COUNT(*) FROM load_manifest WHERE table_name = ?", [table_name]
+        ).fetchone()[0] > 0
+        if full_reload or not has_manifest:
+            # Rows loaded before the manifest existed can't be traced to a file
+            log_changed_beneficiaries(conn, table_name)
+            conn.execute(f"DELETE FROM {table_name}")
+            conn.execute("DELETE FROM load_manifest WHERE table_name = ?", [table_name])
+            print(f"Existing data cleared from {table_name} table")
+
+        changed = changed_sources(conn, table_name, sources)
+        print(f"{len(changed)} of {len(sources)} source files are new or changed")
+        if not changed:
+            conn.commit()
+            return 0
+
+        changed_files = [s['source_file'] for s in changed]
+        log_changed_beneficiaries(conn, table_name, "WHERE list_contains(?, SOURCE_FILE)", [changed_files])
+        for source in changed:
+            deleted = conn.execute(
+                f"DELETE FROM {table_name} WHERE SOURCE_FILE = ?", [source['source_file']]
+            ).fetchone()[0]
+            if deleted:
+                print(f"Removed {deleted} rows previously loaded from {source['source_file']}")
+
+        row_count = insert_changed(changed)
+        log_changed_beneficiaries(conn, table_name, "WHERE list_contains(?, SOURCE_FILE)", [changed_files])
+
+        file_row_counts = dict(conn.execute(f"""
+            SELECT SOURCE_FILE, COUNT(*)
+            FROM {table_name}
+            WHERE list_contains(?, SOURCE_FILE)
+            GROUP BY SOURCE_FILE
+        """, [changed_files]).fetchall())
+        for source in changed:
+            conn.execute("""
+                INSERT OR REPLACE INTO load_manifest
+                    (table_name, source_file, file_size, checksum, row_count, loaded_at)
+                VALUES (?, ?, ?, ?, ?, current_timestamp)
+            """, [table_name, source['source_file'], source['file_size'], source['checksum'],
+                  file_row_counts.get(source['source_file'], 0)])
+        conn.commit()
+        return row_count
+    except Exception:
+        conn.rollback()
+        raise
+
+def extract_zip(zip_file_path, folder):
+    # Unzip the CSV files into folder, for loading them from disk
+    print(f"Found zip file: {zip_file_path}")
+    print("Extracting CSV files...")
+
+    # Create a temporary extraction directory
+    temp_extract_dir = os.path.join(folder, 'temp_extract')
+    if os.path.exists(temp_extract_dir):
+        shutil.rmtree(temp_extract_dir)
+    os.makedirs(temp_extract_dir, exist_ok=True)
+
+    # Extract all files from the zip
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        zip_ref.extractall(temp_extract_dir)
+
+    # Move CSV files to the data folder
+    for file in os.listdir(temp_extract_dir):
+        if file.endswith('.csv'):
+            source_path = os.path.join(temp_extract_dir, file)
+            dest_path = os.path.join(folder, file)
+            shutil.move(source_path, dest_path)
+            print(f"Extracted: {file}")
+
+    # Clean up the temporary directory
+    shutil.rmtree(temp_extract_dir)
+    print("Extraction complete")
+
+def load_csv_files(conn, file_paths, table_name, column_types, order_by=None, full_reload=False, derived_columns=None):
+    # Read all new or changed CSV files in one typed read_csv() scan
+    def insert_changed(changed):
+        headers = {}
+        for s in changed:
+            with open(s['path'], 'rb') as f:
+                headers[s['source_file']] = read_csv_header(f)
+        column_names = headers[changed[0]['source_file']]
+        for source_file, header in headers.items():
+            if header != column_names:
+                raise ValueError(f"{source_file} does not have the same columns as {changed[0]['source_file']}")
+
+        columns = ', '.join(f"'{name}': '{sql_type}'" for name, sql_type in read_types(column_types, column_names).items())
+        extra = extra_columns(column_types, column_names)
+        if extra:
+            print(f"Dropping CSV columns that aren't in {table_name}: {', '.join(extra)}")
+        excluded = ', '.join(['filename'] + [f'"{name}"' for name in extra])
+        file_list = ', '.join(f"'{s['path']}'" for s in changed)
+        source = f"""(
+            SELECT * EXCLUDE ({excluded}), parse_filename(filename) AS SOURCE_FILE
+            FROM read_csv([{file_list}], header=true, auto_detect=false,
+                          columns={{{columns}}}, dateformat='{DATE_FORMAT}', filename=true)
+        )"""
+        return bulk_insert(conn, table_name, source, order_by, derived_columns)
+
+    return sync_table(conn, table_name, disk_sources(file_paths), insert_changed, full_reload)
+
+def load_zip(conn, zip_file_path, table_name, column_types, order_by=None, full_reload=False, derived_columns=None):
+    # Decompress the new or changed CSV members of the zip as a stream and feed
+    # them to DuckDB batch by batch, so nothing is extracted to disk and
+    # decompression overlaps with the insert
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        sources = zip_sources(zip_ref)
+        if not sources:
+            print(f"No CSV files found in {zip_file_path}")
+            return 0
+        print(f"Found {len(sources)} CSV files in {zip_file_path}")
+
+        def insert_changed(changed):
+            members = [s['source_file'] for s in changed]
+            conn.register('csv_stream', zip_batch_reader(zip_ref, members, column_types))
+            try:
+                return bulk_insert(conn, table_name, 'csv_stream', order_by, derived_columns)
+            finally:
+                conn.unregister('csv_stream')
+
+        return sync_table(conn, table_name, sources, insert_changed, full_reload)
@@ -0,0 +1,72 @@
+# Figures of the dashboard, shared with the baseline snapshot the pipeline
+# writes for it (see dashboard_snapshot.py).
+# plotly.express is imported when a figure is first built: importing it takes
+# longer than the rest of the dashboard's startup, and the default view is
+# served with the snapshot's prebuilt figures.
+
+light_text_color = '#333'
+init_min = 0
+init_max = 0.1 # Adjusted for fractional rate (0-1)
+
+def readmission_rates(result):
+    # Calculate Readmission Rate (Removed redundant Pandas groupby)
+    # Calculate Readmission Rate as a fraction (0 to 1) for consistency
+    # Calculate Readmission Rate as a fraction (0 to 1) - removed rounding
+    result['Readmission Rate'] = result['Total Readmissions'] / result['Total Admissions']
+    return result.sort_values('Readmission Rate', ascending=False)
+
+def create_column_chart(data):
+    import plotly.express as px
+    fig = px.bar(data, x='State', y='Readmission Rate', 
+          title='Top 10 States by Readmission Rate'
+     )
+    fig.update_layout(
+        title_x=0.5,
+        xaxis_title='State',
+        yaxis_title='Readmission Rate', # Removed (%) as rate is now fractional
+        xaxis=dict(
+          showgrid=True,  
+          gridcolor='#c8c8c8 ', 
+          title='State',
+          title_font=dict(size=14, color='#787878'), 
+          tickfont=dict(size=12, color='#646464'),
+        ),
+        margin=dict(l=10, r=10, t=60, b=10),
+        template="plotly_white", 
+        font=dict(color="#333"), 
+        plot_bgcolor="#eee", 
+        paper_bgcolor="#eee",
+        font_color=light_text_color
+    )
+    return fig
+
+def create_choropleth_map(data, min_value=init_min, max_value=init_max):
+    import plotly.express as px
+    fig = px.choropleth(
+        data,
+        locations='State',
+        locationmode='USA-states',
+        color='Readmission Rate',
+        scope="usa",
+        color_continuous_scale="Cividis",
+        range_color=[min_value, max_value],
+        title='US Readmission Rates by State',
+        labels={'Readmission Rate': 'Readmission Rate'} # Removed (%) as rate is now fractional
+    )
+    fig.update_layout(
+        geo_scope='usa',
+        title_x=0.5,
+        margin=dict(l=10, r=10, t=60, b=10),
+        geo=dict(bgcolor="#eee"),
+        template="plotly_white", 
+        font=dict(color="#333"), 
+        plot_bgcolor="white", 
+        paper_bgcolor="#eee",
+        font_color=light_text_color
+    )
+    return fig
+
+def default_figures(all_states_data):
+    # Map and top 10 chart of the unfiltered view
+    top_10_data = all_states_data.sort_values('Readmission Rate', ascending=False).head(10).copy()
+    return create_choropleth_map(all_states_data.copy()), create_column_chart(top_10_data)
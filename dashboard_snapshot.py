@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+
+import duckdb
+import pandas as pd
+
+from dashboard_figures import readmission_rates, default_figures
+from result_cache import data_version_query
+
+# Baseline snapshot of the dashboard's default view.
+# main.py writes it once every stage of the pipeline has run: the all-claims
+# state rates (from the readmission_rate cube), the map and chart figures of
+# the unfiltered view as Plotly JSON, and the fixed code lists of the ICD code
+# table. It is stamped with the data version of the database (the latest
+# pipeline run, load and refresh, as in result_cache.py), which is final only
+# after the last stage has been recorded, so it isn't a stage itself.
+# The dashboard reads the file on first use and serves the default view from
+# it, without querying the readmission_rate cube or building the figures, for
+# as long as the database's data version is the one it was written at. After a
+# reload it falls back to its queries; python dashboard_snapshot.py rewrites
+# the snapshot for the current data.
+
+snapshot_file = 'dashboard_snapshot.json'
+
+# All claims, every age group and condition, from the pre-aggregated
+# readmission_rate cube (see calc_readmission_rate.py)
+all_claims_query = """
+        SELECT
+            s.state_abbr as State,
+            SUM(rr.readmissions) as "Total Readmissions",
+            SUM(rr.total_admissions) as "Total Admissions"
+        FROM
+            readmission_rate rr
+        JOIN
+            state s ON rr.SP_STATE_CODE = s.sp_state_code
+        WHERE
+            rr.age_grp_id = 0 AND rr.condition_type_id = 0
+        GROUP BY
+            s.state_abbr
+        """
+
+# Code lists of the ICD code table that don't depend on a search
+code_list_queries = {
+    'none': "SELECT icd10_cm_code, description FROM main.icd10_diag_desc where icd10_cm_code like 'NONE%' order by icd10_cm_code",
+}
+
+def data_version(conn):
+    # The data version as JSON values
+    return [None if value is None else str(value) for value in conn.execute(data_version_query).fetchone()]
+
+def table_json(data):
+    # A DataFrame as its columns, their types and its rows
+    return {
+        'columns': list(data.columns),
+        'dtypes': {column: str(dtype) for column, dtype in data.dtypes.items()},
+        'data': json.loads(data.to_json(orient='values', date_format='iso')),
+    }
+
+def table_frame(table):
+    return pd.DataFrame(table['data'], columns=table['columns']).astype(table['dtypes'])
+
+def run(conn, path=snapshot_file):
+    state_rates = conn.execute(all_claims_query).fetchdf()
+    choropleth, column_chart = default_figures(readmission_rates(state_rates.copy()))
+    snapshot = {
+        'data_version': data_version(conn),
+        'state_rates': table_json(state_rates),
+        'figures': {
+            'choropleth': json.loads(choropleth.to_json()),
+            'column_chart': json.loads(column_chart.to_json()),
+        },
+        'code_lists': {name: table_json(conn.execute(query).fetchdf()) for name, query in code_list_queries.items()},
+    }
+    # Written next to the file and renamed over it, so the dashboard never
+    # reads a partly written snapshot
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(temp_path, path)
+    print(f"Dashboard snapshot written to {path} ({os.path.getsize(path):,} bytes)")
+
+class BaselineSnapshot:
+    def __init__(self, path=snapshot_file):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.snapshot = None
+
+    def load(self):
+        # The snapshot file, read on first use; None without one
+        with self.lock:
+            if not self.loaded:
+                try:
+                    with open(self.path, 'r') as file:
+                        self.snapshot = json.load(file)
+                except FileNotFoundError:
+                    print(f"No dashboard snapshot in {self.path}, the default view is queried")
+                except ValueError as e:
+                    print(f"Ignoring the dashboard snapshot in {self.path}: {e}")
+                self.loaded = True
+            return self.snapshot
+
+    def current(self, conn):
+        # The snapshot if it was written for the data of conn's database, else None
+        snapshot = self.load()
+        if snapshot is None or snapshot['data_version'] != data_version(conn):
+            return None
+        return snapshot
+
+    def state_rates(self, conn):
+        snapshot = self.current(conn)
+        return None if snapshot is None else table_frame(snapshot['state_rates'])
+
+    def code_list(self, conn, name):
+        snapshot = self.current(conn)
+        return None if snapshot is None else table_frame(snapshot['code_lists'][name])
+
+if __name__ == "__main__":
+    with duckdb.connect('claims.duckdb', read_only=True) as conn:
+        run(conn)
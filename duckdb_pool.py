@@ -0,0 +1,65 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+# Read-only DuckDB connection pool for the dashboard.
+# Each process opens the database once and hands every request a cursor of
+# that connection. Cursors share the database instance (its buffer cache and
+# worker threads) but run their queries independently, so concurrent callbacks
+# don't queue up behind one connection. Returned cursors are kept for reuse,
+# up to max_idle of them.
+# The connection is opened on first use by the process that uses it, so a
+# multi-process WSGI server that imports the app before forking its workers
+# (e.g. gunicorn --preload) still gives every worker a connection of its own.
+# on_connect(conn) is called with every new connection, for setting up
+# per-process state such as attached databases.
+# DuckDB's threads setting applies to the whole database instance: it is the
+# number of threads each query of the process can use. With several worker
+# processes, split the cores between them.
+
+class ConnectionPool:
+    def __init__(self, database, threads=None, max_idle=8, on_connect=None):
+        self.database = database
+        self.threads = threads
+        self.on_connect = on_connect
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.pid = None
+        self.conn = None
+        self.idle = []
+
+    def connection(self):
+        # The connection of this process, opened on first use
+        with self.lock:
+            if self.pid != os.getpid():
+                # A pool copied into a forked worker must not use the parent's
+                # connection; its cursors are dropped along with it
+                config = {'threads': self.threads} if self.threads else {}
+                self.conn = duckdb.connect(database=self.database, read_only=True, config=config)
+                if self.on_connect is not None:
+                    self.on_connect(self.conn)
+                self.idle = []
+                self.pid = os.getpid()
+            return self.conn
+
+    @contextmanager
+    def cursor(self):
+        # A cursor for one request, returned to the pool afterwards
+        conn = self.connection()
+        with self.lock:
+            cursor = self.idle.pop() if self.idle else None
+        if cursor is None:
+            cursor = conn.cursor()
+        try:
+            yield cursor
+        except Exception:
+            # A failed query may leave the cursor in an aborted state
+            cursor.close()
+            raise
+        with self.lock:
+            if self.pid == os.getpid() and len(self.idle) < self.max_idle:
+                self.idle.append(cursor)
+                return
+        cursor.close()
@@ -0,0 +1,132 @@
+import duckdb
+import re
+
+# ICD-10-CM code hierarchy: chapter -> category (3 characters) -> subcategory
+# (4 characters) -> code.
+# Every code gets a sortable integer code_num: its characters as base-37
+# digits (1-36 for 0-9 and A-Z, with 0 for the characters past the end of a
+# shorter code), so numeric order is code order and all the codes starting
+# with a prefix form one contiguous range of numbers, which prefix_bounds()
+# computes. icd10_chapters stores that range for every chapter.
+# inpatient_claims_icd10 carries the code number of its principal diagnosis
+# (ICD10_DGNS_NUM), so the dashboard's ICD10_DGNS_CODE LIKE 'I21%' filters run
+# as integer range filters instead of string matching every claim.
+
+code_alphabet = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+code_width = 7
+code_base = len(code_alphabet) + 1
+
+# ICD-10-CM chapters as (first category, last category, title)
+chapters = [
+    ('A00', 'B99', 'Certain infectious and parasitic diseases'),
+    ('C00', 'D49', 'Neoplasms'),
+    ('D50', 'D89', 'Diseases of the blood and blood-forming organs and certain disorders involving the immune mechanism'),
+    ('E00', 'E89', 'Endocrine, nutritional and metabolic diseases'),
+    ('F01', 'F99', 'Mental, behavioral and neurodevelopmental disorders'),
+    ('G00', 'G99', 'Diseases of the nervous system'),
+    ('H00', 'H59', 'Diseases of the eye and adnexa'),
+    ('H60', 'H95', 'Diseases of the ear and mastoid process'),
+    ('I00', 'I99', 'Diseases of the circulatory system'),
+    ('J00', 'J99', 'Diseases of the respiratory system'),
+    ('K00', 'K95', 'Diseases of the digestive system'),
+    ('L00', 'L99', 'Diseases of the skin and subcutaneous tissue'),
+    ('M00', 'M99', 'Diseases of the musculoskeletal system and connective tissue'),
+    ('N00', 'N99', 'Diseases of the genitourinary system'),
+    ('O00', 'O9A', 'Pregnancy, childbirth and the puerperium'),
+    ('P00', 'P96', 'Certain conditions originating in the perinatal period'),
+    ('Q00', 'Q99', 'Congenital malformations, deformations and chromosomal abnormalities'),
+    ('R00', 'R99', 'Symptoms, signs and abnormal clinical and laboratory findings, not elsewhere classified'),
+    ('S00', 'T88', 'Injury, poisoning and certain other consequences of external causes'),
+    ('U00', 'U85', 'Codes for special purposes'),
+    ('V00', 'Y99', 'External causes of morbidity'),
+    ('Z00', 'Z99', 'Factors influencing health status and contact with health services'),
+]
+
+def code_number(code):
+    number = 0
+    for i in range(code_width):
+        number = number * code_base + (code_alphabet.index(code[i]) + 1 if i < len(code) else 0)
+    return number
+
+def prefix_bounds(prefix):
+    # First and last code_num of the codes starting with prefix
+    start = code_number(prefix)
+    return start, start + code_base ** (code_width - len(prefix)) - 1
+
+def code_number_sql(column):
+    # code_number() as a SQL expression. Characters outside code_alphabet
+    # count as 0, so such codes never fall in the range of a prefix they
+    # don't start with.
+    digits = [
+        f"(CASE WHEN length({column}) >= {i + 1} THEN instr('{code_alphabet}', substr({column}, {i + 1}, 1)) ELSE 0 END)"
+        f" * {code_base ** (code_width - 1 - i)}"
+        for i in range(code_width)
+    ]
+    return f"CASE WHEN {column} IS NOT NULL THEN {' + '.join(digits)} END"
+
+def chapter_values():
+    rows = []
+    for number, (first, last, title) in enumerate(chapters, start=1):
+        rows.append(f"({number}, '{first}-{last}', '{title}', {prefix_bounds(first)[0]}, {prefix_bounds(last)[1]})")
+    return ',\n        '.join(rows)
+
+def build_hierarchy(conn):
+    # Codes come from the ICD-10-CM code list and from the targets of the
+    # diagnosis crosswalk, so every ICD-10 code a claim can have is included
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE icd10_chapters AS
+        SELECT * FROM (VALUES
+        {chapter_values()}
+        ) AS t(chapter, code_range, title, range_start, range_end)
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE icd10_hierarchy AS
+        WITH codes AS (
+            SELECT icd10_cm_code, MIN(description) AS description
+            FROM (
+                SELECT trim(icd10_cm_code) AS icd10_cm_code, description FROM icd10_diag_desc
+                UNION ALL
+                SELECT icd10, NULL FROM icd_diag_xwalk
+            )
+            WHERE regexp_matches(icd10_cm_code, '^[A-Z][0-9A-Z]{{2,6}}$')
+            GROUP BY icd10_cm_code
+        )
+        SELECT
+            c.icd10_cm_code,
+            {code_number_sql('c.icd10_cm_code')} AS code_num,
+            ch.chapter,
+            substr(c.icd10_cm_code, 1, 3) AS category,
+            CASE WHEN length(c.icd10_cm_code) >= 4 THEN substr(c.icd10_cm_code, 1, 4) END AS subcategory,
+            c.description
+        FROM codes c
+        LEFT JOIN icd10_chapters ch
+            ON {code_number_sql('c.icd10_cm_code')} BETWEEN ch.range_start AND ch.range_end
+        ORDER BY code_num
+    """)
+
+# col LIKE 'I21%' or col NOT LIKE 'I21%', with col optionally qualified
+like_prefix_pattern = r"(?i:(\b\w+\.)?\b{column}\s+(NOT\s+)?LIKE\s+)'([0-9A-Z]{{1,7}})%'"
+
+def prefix_filters_to_ranges(sql, column, number_column):
+    # Rewrite the LIKE 'prefix%' filters on the code column in sql into
+    # BETWEEN filters on number_column, the code number of the same code
+    def to_range(match):
+        start, end = prefix_bounds(match.group(3))
+        negation = 'NOT ' if match.group(2) else ''
+        return f"{match.group(1) or ''}{number_column} {negation}BETWEEN {start} AND {end}"
+    return re.sub(like_prefix_pattern.format(column=column), to_range, sql)
+
+def run(conn):
+    build_hierarchy(conn)
+    code_count, unassigned = conn.execute(
+        "SELECT COUNT(*), COUNT(*) - COUNT(chapter) FROM icd10_hierarchy"
+    ).fetchone()
+    print(f"icd10_hierarchy has {code_count} codes, {unassigned} outside the chapter ranges")
+
+if __name__ == "__main__":
+    conn = duckdb.connect('claims.duckdb')
+    try:
+        run(conn)
+    finally:
+        conn.close()
+        print("Database connection closed.")
@@ -1,22 +1,175 @@
-import duckdb
-import pandas as pd
-
-file_path = "data/icd/gem_i9diag.txt"
-colspecs = [(0, 5), (5, 14)]
-col_names = ["icd9", "icd10"]
-
-df = pd.read_fwf(file_path, colspecs=colspecs, names=col_names, dtype=str)
-
-duckdb_file = "claims.duckdb"
-conn = duckdb.connect(duckdb_file)
-
-conn.register("temp_df",df)
-
-conn.execute("DROP TABLE IF EXISTS icd_diag_xwalk")
-conn.execute("DROP TABLE IF EXISTS inpatient_claims_icd10")
-
-conn.execute("CREATE TABLE icd_diag_xwalk AS SELECT * FROM temp_df")
-conn.execute("CREATE TABLE inpatient_claims_icd10  as select c.DESYNPUF_ID, c.CLM_ID ,c.CLM_FROM_DT, c.CLM_THRU_DT, c.CLM_PMT_AMT, c.CLM_ADMSN_DT,c.CLM_UTLZTN_DAY_CNT,c.NCH_BENE_DSCHRG_DT ,c.CLM_DRG_CD ,c.ICD9_DGNS_CD_1,i.icd10 as ICD10_DGNS_CODE FROM INPATIENT_CLAIMS c left join (select icd9, min(icd10) as icd10 from icd_diag_xwalk group by icd9) i ON c.ICD9_DGNS_CD_1 = i.icd9")
-
-conn.close()
-print("Database connection closed.")
\ No newline at end of file
+import duckdb
+import sys
+from csv_loader import disk_sources, changed_sources
+from icd10_hierarchy import code_number_sql
+from incremental import stage_changed_beneficiaries, mark_refreshed
+
+file_path = "data/icd/gem_i9diag.txt"
+
+def gem_query(gem_path):
+    # Fixed-width GEM layout: ICD-9 code in characters 1-5, ICD-10 code in 6-14
+    return f"""
+        SELECT
+            trim(substr(line, 1, 5)) AS icd9,
+            trim(substr(line, 6, 9)) AS icd10
+        FROM read_csv('{gem_path}', header=false, columns={{'line': 'VARCHAR'}},
+                      delim='\\t', quote='', escape='', auto_detect=false)
+    """
+
+diagnosis_positions = range(1, 11)
+
+# Claims with the ICD-10 code of each diagnosis position. The ICD-9 codes of all
+# positions come from claim_codes and are mapped with a single join on
+# icd_diag_map, then put back on their claim rows. ICD10_DGNS_CODE is the
+# code of the first position, which the dashboard filters on, and
+# ICD10_DGNS_NUM its code number (see icd10_hierarchy.py) for prefix filters
+# as integer ranges.
+claims_icd10_query = """
+    WITH mapped_codes AS (
+        SELECT
+            cc.DESYNPUF_ID,
+            cc.CLM_ID,
+            cc.SEGMENT,
+            {icd10_columns}
+        FROM claim_codes cc
+        JOIN icd_diag_map m ON cc.code = m.icd9
+        WHERE cc.code_type = 'ICD9_DX'
+        {code_filter}
+        GROUP BY cc.DESYNPUF_ID, cc.CLM_ID, cc.SEGMENT
+    )
+    SELECT
+        c.DESYNPUF_ID,
+        c.CLM_ID,
+        c.CLM_FROM_DT,
+        c.CLM_THRU_DT,
+        c.CLM_PMT_AMT,
+        c.CLM_ADMSN_DT,
+        c.CLM_UTLZTN_DAY_CNT,
+        c.NCH_BENE_DSCHRG_DT,
+        c.CLM_DRG_CD,
+        c.ICD9_DGNS_CD_1,
+        m.ICD10_DGNS_CD_1 AS ICD10_DGNS_CODE,
+        c.SEGMENT,
+        {mapped_columns},
+        {code_number} AS ICD10_DGNS_NUM
+    FROM inpatient_claims c
+    LEFT JOIN mapped_codes m
+        ON c.DESYNPUF_ID = m.DESYNPUF_ID AND c.CLM_ID = m.CLM_ID AND c.SEGMENT = m.SEGMENT
+    WHERE true
+    {claim_filter}
+    ORDER BY c.DESYNPUF_ID, c.CLM_ADMSN_DT
+"""
+
+def claims_icd10_select(changed_only=False):
+    # changed_only: only the claims of the beneficiaries in changed_benes
+    icd10_columns = ',\n            '.join(
+        f"MAX(CASE WHEN cc.position = {n} THEN m.icd10 END) AS ICD10_DGNS_CD_{n}" for n in diagnosis_positions
+    )
+    mapped_columns = ', '.join(f"m.ICD10_DGNS_CD_{n}" for n in diagnosis_positions)
+    return claims_icd10_query.format(
+        icd10_columns=icd10_columns,
+        mapped_columns=mapped_columns,
+        code_number=code_number_sql('m.ICD10_DGNS_CD_1'),
+        code_filter="AND cc.DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)" if changed_only else '',
+        claim_filter="AND c.DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)" if changed_only else ''
+    )
+
+def load_gem(conn, gem_path, table_name, order_by='icd9'):
+    # Load a GEM file into table_name, unless the file is unchanged since it
+    # was last loaded (per load_manifest). Returns True if it was loaded.
+    table_exists = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name = ?", [table_name]
+    ).fetchone()
+    sources = disk_sources([gem_path])
+    if table_exists and not changed_sources(conn, table_name, sources):
+        print(f"{table_name} is up to date with {gem_path}.")
+        return False
+
+    conn.begin()
+    try:
+        conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS {gem_query(gem_path)} ORDER BY {order_by}")
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        for source in sources:
+            conn.execute("""
+                INSERT OR REPLACE INTO load_manifest
+                    (table_name, source_file, file_size, checksum, row_count, loaded_at)
+                VALUES (?, ?, ?, ?, ?, current_timestamp)
+            """, [table_name, source['source_file'], source['file_size'], source['checksum'], row_count])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Loaded {row_count} mappings from {gem_path} into {table_name}")
+    return True
+
+def load_crosswalk(conn):
+    # Reload the diagnosis GEM and the ICD-9 -> ICD-10 map when the file changed.
+    # Returns True if they were reloaded.
+    map_exists = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='icd_diag_map'"
+    ).fetchone()
+    if not load_gem(conn, file_path, 'icd_diag_xwalk') and map_exists:
+        return False
+
+    # One ICD-10 code per ICD-9 code. A GEM can map an ICD-9 code to several
+    # ICD-10 codes; the lowest one is used.
+    conn.execute("""
+        CREATE OR REPLACE TABLE icd_diag_map AS
+        SELECT icd9, MIN(icd10) AS icd10
+        FROM icd_diag_xwalk
+        GROUP BY icd9
+        ORDER BY icd9
+    """)
+    return True
+
+def refresh_claims_icd10(conn, full_refresh=False):
+    # Rebuild inpatient_claims_icd10, or replace the claims of just the
+    # beneficiaries whose claims changed since the last refresh
+    bene_count, newest_change = stage_changed_beneficiaries(conn, 'inpatient_claims_icd10')
+    table_exists = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='inpatient_claims_icd10'"
+    ).fetchone()
+    refreshed_before = conn.execute(
+        "SELECT target FROM refresh_log WHERE target = 'inpatient_claims_icd10'"
+    ).fetchone()
+    # A table built with other columns than the query has now is rebuilt
+    columns_changed = table_exists and (
+        conn.execute("SELECT * FROM inpatient_claims_icd10 LIMIT 0").description !=
+        conn.execute(f"SELECT * FROM ({claims_icd10_select()}) LIMIT 0").description
+    )
+
+    conn.begin()
+    try:
+        if full_refresh or not table_exists or not refreshed_before or columns_changed:
+            print("Building the inpatient_claims_icd10 table...")
+            conn.execute(f"CREATE OR REPLACE TABLE inpatient_claims_icd10 AS {claims_icd10_select()}")
+        elif bene_count == 0:
+            print("No claims changed since the last refresh.")
+        else:
+            print(f"Refreshing inpatient_claims_icd10 for {bene_count} beneficiaries with changed claims...")
+            conn.execute("DELETE FROM inpatient_claims_icd10 WHERE DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)")
+            conn.execute(f"INSERT INTO inpatient_claims_icd10 {claims_icd10_select(changed_only=True)}")
+        mark_refreshed(conn, 'inpatient_claims_icd10', newest_change)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def run(conn, full_refresh=False):
+    # claim_codes has to be up to date (see claim_codes.py)
+    crosswalk_changed = load_crosswalk(conn)
+    refresh_claims_icd10(conn, full_refresh or crosswalk_changed)
+
+    row_count, mapped_count = conn.execute(
+        "SELECT COUNT(*), COUNT(ICD10_DGNS_CODE) FROM inpatient_claims_icd10"
+    ).fetchone()
+    print(f"inpatient_claims_icd10 has {row_count} claims, {mapped_count} with a mapped principal diagnosis")
+
+if __name__ == "__main__":
+    duckdb_file = "claims.duckdb"
+    conn = duckdb.connect(duckdb_file)
+    try:
+        run(conn, full_refresh='--full' in sys.argv)
+    finally:
+        conn.close()
+        print("Database connection closed.")
@@ -0,0 +1,104 @@
+import duckdb
+import sys
+from claim_codes import prefix_range
+from icd_codes_import import load_gem
+from incremental import stage_changed_beneficiaries, mark_refreshed
+
+file_path = "data/icd/gem_i9pcs.txt"
+
+# claim_procedures_icd10 has one row per ICD-10-PCS code that a procedure code
+# of a claim maps to. An ICD-9 procedure usually maps to several ICD-10-PCS
+# codes, so every mapping is kept instead of picking one. The table is sorted
+# by ICD-10-PCS code, so a range filter on icd10 reads few row groups.
+claim_procedures_query = """
+    SELECT
+        cc.DESYNPUF_ID,
+        cc.CLM_ID,
+        cc.SEGMENT,
+        cc.position,
+        cc.code AS icd9,
+        x.icd10
+    FROM claim_codes cc
+    JOIN icd_prcdr_xwalk x ON cc.code = x.icd9
+    WHERE cc.code_type = 'ICD9_PRCDR'
+      AND x.icd10 <> 'NoPCS'
+      {bene_filter}
+    ORDER BY x.icd10, cc.CLM_ID
+"""
+
+# Procedure cohorts of the conditions table (addtional_script.sql) by
+# ICD-10-PCS code prefix
+procedure_cohorts = {
+    'Coronary Artery Bypass Graft (CABG) Surgery': ['0210', '0211', '0212', '0213'],
+    'Total Hip Arthroplasty / Total Knee Arthroplasty (THA/TKA)': ['0SR9', '0SRB', '0SRC', '0SRD'],
+}
+
+def procedure_claims_query(prefixes):
+    # SELECT of the claim rows with a procedure mapping to any of the
+    # ICD-10-PCS prefixes, for use as a semi-join on (CLM_ID, SEGMENT).
+    # The prefixes are resolved to ICD-9 codes on the small crosswalk first,
+    # which finds the same claims as claim_procedures_icd10 without scanning
+    # its one row per mapping.
+    ranges = ' OR '.join(prefix_range(prefix, 'icd10') for prefix in prefixes)
+    return f"""
+        SELECT DISTINCT CLM_ID, SEGMENT
+        FROM claim_codes
+        WHERE code_type = 'ICD9_PRCDR'
+          AND code IN (SELECT icd9 FROM icd_prcdr_xwalk WHERE {ranges})
+    """
+
+def refresh_claim_procedures(conn, full_refresh=False):
+    # Rebuild claim_procedures_icd10, or replace the procedures of just the
+    # beneficiaries whose claims changed since the last refresh
+    bene_count, newest_change = stage_changed_beneficiaries(conn, 'claim_procedures_icd10')
+    table_exists = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='claim_procedures_icd10'"
+    ).fetchone()
+    refreshed_before = conn.execute(
+        "SELECT target FROM refresh_log WHERE target = 'claim_procedures_icd10'"
+    ).fetchone()
+
+    conn.begin()
+    try:
+        if full_refresh or not table_exists or not refreshed_before:
+            print("Building the claim_procedures_icd10 table...")
+            conn.execute(f"""
+                CREATE OR REPLACE TABLE claim_procedures_icd10 AS
+                {claim_procedures_query.format(bene_filter='')}
+            """)
+        elif bene_count == 0:
+            print("No claims changed since the last refresh.")
+        else:
+            print(f"Refreshing claim_procedures_icd10 for {bene_count} beneficiaries with changed claims...")
+            conn.execute("DELETE FROM claim_procedures_icd10 WHERE DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)")
+            conn.execute(f"""
+                INSERT INTO claim_procedures_icd10
+                {claim_procedures_query.format(bene_filter='AND cc.DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)')}
+            """)
+        mark_refreshed(conn, 'claim_procedures_icd10', newest_change)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def run(conn, full_refresh=False):
+    # claim_codes has to be up to date (see claim_codes.py)
+    crosswalk_changed = load_gem(conn, file_path, 'icd_prcdr_xwalk')
+    refresh_claim_procedures(conn, full_refresh or crosswalk_changed)
+
+    row_count, claim_count = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT CLM_ID) FROM claim_procedures_icd10"
+    ).fetchone()
+    print(f"claim_procedures_icd10 has {row_count} ICD-10-PCS codes for {claim_count} claims")
+    for cohort, prefixes in procedure_cohorts.items():
+        cohort_count = conn.execute(f"SELECT COUNT(*) FROM ({procedure_claims_query(prefixes)})").fetchone()[0]
+        print(f"{cohort}: {cohort_count} claims")
+
+if __name__ == "__main__":
+    duckdb_file = "claims.duckdb"
+    conn = duckdb.connect(duckdb_file)
+    try:
+        run(conn, full_refresh='--full' in sys.argv)
+    finally:
+        conn.close()
+        print("Database connection closed.")
@@ -0,0 +1,183 @@
+import bisect
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+# Full-text search over the ICD-10-CM code descriptions (icd10_diag_desc).
+# An in-memory inverted index, built once per process from the table, ranks
+# the codes matching a question with BM25. resolve() turns a condition like
+# "heart attack" into the codes whose descriptions contain every term of it,
+# after synonyms (lay terms and abbreviations -> the wording of the code
+# descriptions) and stemming, as ICD10_DGNS_CODE prefix filters in the form
+# the LLM answers in. Questions with words the descriptions don't use aren't
+# resolved, so the dashboard can send them to the LLM instead.
+
+# BM25 parameters
+k1 = 1.2
+b = 0.75
+
+# Question words that don't name a condition
+stop_words = {
+    'a', 'an', 'and', 'any', 'are', 'as', 'at', 'by', 'claims', 'condition', 'conditions', 'diagnosed',
+    'diagnosis', 'find', 'for', 'from', 'give', 'had', 'has', 'have', 'i', 'in', 'is', 'list', 'me', 'of',
+    'on', 'or', 'patient', 'patients', 'people', 'rate', 'rates', 'readmission', 'readmissions',
+    'readmitted', 'related', 'show', 'the', 'those', 'to', 'what', 'which', 'who', 'with',
+}
+
+# Lay terms and abbreviations -> wording of the code descriptions
+synonyms = {
+    'heart attack': 'myocardial infarction',
+    'ami': 'acute myocardial infarction',
+    'mi': 'myocardial infarction',
+    'chf': 'heart failure',
+    'copd': 'chronic obstructive pulmonary disease',
+    'ckd': 'chronic kidney disease',
+    'esrd': 'end stage renal disease',
+    'stroke': 'cerebral infarction',
+    'high blood pressure': 'hypertension',
+    'afib': 'atrial fibrillation',
+    'uti': 'urinary tract infection',
+    'flu': 'influenza',
+    'cancer': 'malignant neoplasm',
+    'tumor': 'neoplasm',
+    'broken': 'fracture',
+    'blood clot': 'thrombosis',
+    'renal failure': 'kidney failure',
+}
+
+# Word endings stem() removes after the plural, longest first
+suffixes = ['ation', 'ical', 'ion', 'ity', 'ive', 'ing', 'ic', 'ed', 'al']
+
+def stem(word):
+    # Light suffix stripping: diabetes, diabetic -> diabet;
+    # infections, infection -> infect; fractures, fracture -> fractur
+    if len(word) > 4 and word.endswith('ies'):
+        word = word[:-3] + 'y'
+    elif len(word) > 4 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            break
+    if word.endswith('e') and len(word) > 4:
+        word = word[:-1]
+    return word
+
+def words(text):
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+def description_words(description):
+    # Words of a description, leaving out what it excludes: "Hypertensive
+    # heart disease without heart failure" isn't a heart failure code
+    return words(re.sub(r'\bwithout\b[^,]*', '', description, flags=re.IGNORECASE))
+
+def apply_synonyms(text):
+    text = ' ' + ' '.join(words(text)) + ' '
+    for phrase, replacement in synonyms.items():
+        text = text.replace(f' {phrase} ', f' {replacement} ')
+    return text
+
+class IcdSearchIndex:
+    def __init__(self, conn):
+        # Postings: term -> {document number: term frequency}
+        start = time.perf_counter()
+        rows = conn.execute(
+            "SELECT icd10_cm_code, description FROM icd10_diag_desc "
+            "WHERE description IS NOT NULL ORDER BY icd10_cm_code"
+        ).fetchall()
+        self.codes = [code for code, _ in rows]
+        self.postings = defaultdict(dict)
+        self.lengths = []
+        stems = {}
+        for doc, (_, description) in enumerate(rows):
+            terms = [stems.setdefault(word, stem(word)) for word in description_words(description)]
+            self.lengths.append(len(terms))
+            for term in terms:
+                self.postings[term][doc] = self.postings[term].get(doc, 0) + 1
+        self.postings = dict(self.postings)
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        print(f"Indexed {len(self.codes)} ICD-10-CM descriptions in {time.perf_counter() - start:.2f} seconds")
+
+    def query_terms(self, question):
+        # Stemmed terms of a question, None when it has words the descriptions don't use
+        terms = []
+        for word in words(apply_synonyms(question)):
+            if word in stop_words:
+                continue
+            term = stem(word)
+            if term not in self.postings:
+                return None
+            if term not in terms:
+                terms.append(term)
+        return terms or None
+
+    def search(self, question):
+        # Numbers and BM25 scores of the documents with every term, best first
+        terms = self.query_terms(question)
+        if terms is None:
+            return []
+        terms.sort(key=lambda term: len(self.postings[term]))
+        docs = set(self.postings[terms[0]])
+        for term in terms[1:]:
+            docs.intersection_update(self.postings[term])
+        scores = dict.fromkeys(docs, 0.0)
+        for term in terms:
+            postings = self.postings[term]
+            idf = math.log(1 + (len(self.codes) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc in docs:
+                tf = postings[doc]
+                norm = k1 * (1 - b + b * self.lengths[doc] / self.average_length)
+                scores[doc] += idf * tf * (k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def code_prefixes(self, docs):
+        # Shortest prefixes (at least a category) all of whose codes are in docs
+        matched = sorted(docs)
+        prefixes = []
+        for doc in matched:
+            code = self.codes[doc]
+            if prefixes and code.startswith(prefixes[-1]):
+                continue
+            for length in range(3, len(code) + 1):
+                prefix = code[:length]
+                # Codes are sorted, so the codes of a prefix are the documents
+                # first to last - 1, and matched has all of them when it has
+                # them as a run of that length
+                first = bisect.bisect_left(self.codes, prefix)
+                last = bisect.bisect_left(self.codes, prefix + '\x7f')
+                start = bisect.bisect_left(matched, first)
+                end = start + last - first
+                if end <= len(matched) and matched[start] == first and matched[end - 1] == last - 1:
+                    prefixes.append(prefix)
+                    break
+            else:
+                prefixes.append(code)
+        return prefixes
+
+    def resolve(self, question):
+        # The question's codes as SQL in the LLM's answer format, or None
+        matches = self.search(question)
+        if not matches:
+            return None
+        conditions = ' OR '.join(f"ICD10_DGNS_CODE LIKE '{prefix}%'"
+                                 for prefix in self.code_prefixes(doc for doc, _ in matches))
+        return f"$$$\nSELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE {conditions}\n$$$"
+
+class LazyIcdSearchIndex:
+    # The index of this process, built on first use
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self.lock = threading.Lock()
+        self.index = None
+
+    def get(self):
+        with self.lock:
+            if self.index is None:
+                with self.db_pool.cursor() as cursor:
+                    self.index = IcdSearchIndex(cursor)
+            return self.index
+
+    def resolve(self, question):
+        return self.get().resolve(question)
@@ -1,26 +1,13 @@
 import duckdb
+import sys
+from incremental import stage_changed_beneficiaries, mark_refreshed
 
-try:
-    # Connect to the existing DuckDB database
-    conn = duckdb.connect('claims.duckdb')
-    print("Successfully connected to the database.")
-
-    # Check if the inpatient_claims table exists
-    table_check = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='inpatient_claims'").fetchone()
-    if not table_check:
-        print("Error: The inpatient_claims table does not exist.")
-        conn.close()
-        exit(1)
-    else:
-        print("The inpatient_claims table exists.")
-
-    # Get the count of rows in the inpatient_claims table
-    row_count = conn.execute("SELECT COUNT(*) FROM inpatient_claims").fetchone()[0]
-    print(f"Total number of rows in inpatient_claims table: {row_count}")
-
-    # SQL query to create the all_cause_readmission view
-    create_view_query = """
-    CREATE OR REPLACE VIEW all_cause_readmission AS
+# SQL query selecting the readmissions. all_cause_readmission is materialized
+# from it, and because the window is per beneficiary it can be recomputed for
+# just the beneficiaries whose claims changed ({bene_filter}).
+# Claims admitted on the same day are ordered by CLM_ID and SEGMENT, so the result doesn't
+# depend on the order the rows are stored in, which loads and refreshes change.
+readmission_query = """
     WITH ordered_claims AS (
   SELECT 
     DESYNPUF_ID,
@@ -28,20 +15,16 @@ try:
     CLM_ADMSN_DT,
     NCH_BENE_DSCHRG_DT,
     ICD9_DGNS_CD_1,
-    ICD9_DGNS_CD_2,
-    ICD9_DGNS_CD_3,
-    ICD9_DGNS_CD_4,
-    ICD9_DGNS_CD_5,
-    ICD9_DGNS_CD_6,
-    ICD9_DGNS_CD_7,
-    ICD9_DGNS_CD_8,
-    ICD9_DGNS_CD_9,
     ICD9_PRCDR_CD_1,
-    LAG(NCH_BENE_DSCHRG_DT) OVER (PARTITION BY DESYNPUF_ID ORDER BY CLM_ADMSN_DT) AS prev_discharge_date,
-    LAG(ICD9_DGNS_CD_1) OVER (PARTITION BY DESYNPUF_ID ORDER BY CLM_ADMSN_DT) AS prev_diagnosis
+    PSYCH_FLAG,
+    REHAB_FLAG,
+    AMA_FLAG,
+    LAG(NCH_BENE_DSCHRG_DT) OVER (PARTITION BY DESYNPUF_ID ORDER BY CLM_ADMSN_DT, CLM_ID, SEGMENT) AS prev_discharge_date,
+    LAG(ICD9_DGNS_CD_1) OVER (PARTITION BY DESYNPUF_ID ORDER BY CLM_ADMSN_DT, CLM_ID, SEGMENT) AS prev_diagnosis
   FROM main.inpatient_claims
   WHERE NCH_BENE_DSCHRG_DT IS NOT NULL
     AND CLM_ADMSN_DT IS NOT NULL
+    {bene_filter}
 ),
 readmissions AS (
   SELECT 
@@ -56,11 +39,9 @@ readmissions AS (
     CASE 
       WHEN CLM_ADMSN_DT - prev_discharge_date <= 30 
       AND CLM_ADMSN_DT <> prev_discharge_date
-      AND ICD9_DGNS_CD_1 != 'V57' -- Exclude rehabilitation admissions
-      AND ICD9_DGNS_CD_1 NOT LIKE '29%' -- Exclude psychiatric admissions
-      AND ICD9_DGNS_CD_1 NOT LIKE '30%'
-      AND ICD9_DGNS_CD_1 NOT LIKE '31%'
-      AND 'V642' NOT IN (ICD9_DGNS_CD_1, ICD9_DGNS_CD_2, ICD9_DGNS_CD_3, ICD9_DGNS_CD_4, ICD9_DGNS_CD_5, ICD9_DGNS_CD_6, ICD9_DGNS_CD_7, ICD9_DGNS_CD_8, ICD9_DGNS_CD_9) -- Exclude left against medical advice
+      AND NOT REHAB_FLAG -- Exclude rehabilitation admissions
+      AND NOT PSYCH_FLAG -- Exclude psychiatric admissions
+      AND NOT AMA_FLAG -- Exclude left against medical advice
       THEN 1
       ELSE 0
     END AS is_readmission
@@ -77,14 +58,60 @@ SELECT
   prev_diagnosis,
   is_readmission
 FROM readmissions
-WHERE is_readmission = 1;
-    """
+WHERE is_readmission = 1
+"""
+
+def refresh_all_cause_readmission(conn, full_refresh=False):
+    # Materialize all_cause_readmission, or refresh only the beneficiaries
+    # whose claims changed since the last refresh
+    table_type = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = 'all_cause_readmission'"
+    ).fetchone()
+    bene_count, newest_change = stage_changed_beneficiaries(conn, 'all_cause_readmission')
 
-    print("Creating the all_cause_readmission view...")
-    conn.execute(create_view_query)
-    print("View created successfully.")
+    conn.begin()
+    try:
+        if table_type is None or table_type[0] != 'BASE TABLE' or full_refresh:
+            print("Building the all_cause_readmission table...")
+            if table_type is not None and table_type[0] == 'VIEW':
+                # Older databases have all_cause_readmission as a view
+                conn.execute("DROP VIEW all_cause_readmission")
+            conn.execute(f"""
+                CREATE OR REPLACE TABLE all_cause_readmission AS
+                {readmission_query.format(bene_filter='')}
+                ORDER BY DESYNPUF_ID, CLM_ADMSN_DT
+            """)
+        elif bene_count == 0:
+            print("No claims changed since the last refresh.")
+        else:
+            print(f"Refreshing all_cause_readmission for {bene_count} beneficiaries with changed claims...")
+            conn.execute("DELETE FROM all_cause_readmission WHERE DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)")
+            conn.execute(f"""
+                INSERT INTO all_cause_readmission
+                {readmission_query.format(bene_filter='AND DESYNPUF_ID IN (SELECT DESYNPUF_ID FROM changed_benes)')}
+            """)
+        mark_refreshed(conn, 'all_cause_readmission', newest_change)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-    # Query to select from the view
+def run(conn, full_refresh=False):
+    # Check if the inpatient_claims table exists
+    table_check = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='inpatient_claims'").fetchone()
+    if not table_check:
+        raise RuntimeError("The inpatient_claims table does not exist.")
+    else:
+        print("The inpatient_claims table exists.")
+
+    # Get the count of rows in the inpatient_claims table
+    row_count = conn.execute("SELECT COUNT(*) FROM inpatient_claims").fetchone()[0]
+    print(f"Total number of rows in inpatient_claims table: {row_count}")
+
+    refresh_all_cause_readmission(conn, full_refresh)
+    print("all_cause_readmission table refreshed successfully.")
+
+    # Query to select from the table
     select_query = "SELECT * FROM all_cause_readmission LIMIT 10"
 
     print("Executing the readmissions query...")
@@ -102,11 +129,19 @@ WHERE is_readmission = 1;
     total_readmissions = conn.execute("SELECT COUNT(*) FROM all_cause_readmission").fetchone()[0]
     print(f"\nTotal number of readmissions: {total_readmissions}")
 
-except Exception as e:
-    print(f"An error occurred: {str(e)}")
+if __name__ == "__main__":
+    try:
+        # Connect to the existing DuckDB database
+        conn = duckdb.connect('claims.duckdb')
+        print("Successfully connected to the database.")
+        run(conn, full_refresh='--full' in sys.argv)
+
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        raise
 
-finally:
-    # Close the database connection
-    if 'conn' in locals():
-        conn.close()
-        print("Database connection closed.")
+    finally:
+        # Close the database connection
+        if 'conn' in locals():
+            conn.close()
+            print("Database connection closed.")
@@ -0,0 +1,42 @@
+# Helpers for refreshing derived tables incrementally.
+# The loader writes the beneficiaries whose rows it deletes or inserts to
+# bene_change_log. A derived table that is computed per beneficiary can then
+# recompute only the beneficiaries changed since its last refresh, which is
+# recorded in refresh_log as the newest change it has consumed.
+
+def log_changed_beneficiaries(conn, table_name, where_clause="", params=None):
+    # Record the beneficiaries of the rows of table_name matching where_clause
+    conn.execute(f"""
+        INSERT INTO bene_change_log (table_name, DESYNPUF_ID, changed_at)
+        SELECT DISTINCT '{table_name}', DESYNPUF_ID, current_timestamp
+        FROM {table_name}
+        {where_clause}
+    """, params or [])
+
+def last_refresh(conn, target):
+    row = conn.execute("SELECT refreshed_through FROM refresh_log WHERE target = ?", [target]).fetchone()
+    return row[0] if row else None
+
+def stage_changed_beneficiaries(conn, target, source_table='inpatient_claims'):
+    # Put the beneficiaries changed in source_table since target was last
+    # refreshed into the temp table changed_benes.
+    # Returns (number of beneficiaries, newest change included).
+    since = last_refresh(conn, target)
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE changed_benes AS
+        SELECT DISTINCT DESYNPUF_ID
+        FROM bene_change_log
+        WHERE table_name = ?
+          AND (CAST(? AS TIMESTAMP) IS NULL OR changed_at > ?)
+    """, [source_table, since, since])
+    bene_count = conn.execute("SELECT COUNT(*) FROM changed_benes").fetchone()[0]
+    newest = conn.execute(
+        "SELECT MAX(changed_at) FROM bene_change_log WHERE table_name = ?", [source_table]
+    ).fetchone()[0]
+    return bene_count, newest
+
+def mark_refreshed(conn, target, refreshed_through):
+    conn.execute("""
+        INSERT OR REPLACE INTO refresh_log (target, refreshed_through, refreshed_at)
+        VALUES (?, ?, current_timestamp)
+    """, [target, refreshed_through])
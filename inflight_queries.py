@@ -0,0 +1,101 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+# Tracks the dashboard's running queries so they can be stopped early.
+# Every query belongs to a browser session and to the Update Data click that
+# started it. When a later click of the same session starts a query, the older
+# one is interrupted with DuckDB's connection interrupt: right away when it
+# runs in this process, and within poll_seconds when it runs in another worker
+# process, which learns of the newer click through the shared store (a
+# diskcache the worker processes share). A query still running after
+# timeout_seconds is interrupted as well.
+
+class QueryInterrupted(RuntimeError):
+    def __init__(self, reason):
+        super().__init__(f"Query {reason}")
+        self.reason = reason  # 'superseded' or 'timed out'
+
+class InflightQueries:
+    def __init__(self, timeout_seconds, shared=None, poll_seconds=0.25):
+        self.timeout_seconds = timeout_seconds
+        self.shared = shared
+        self.poll_seconds = poll_seconds
+        self.lock = threading.Lock()
+        self.running = {}  # id -> query: cursor, session, click, deadline, reason
+        self.monitor = None
+
+    def latest_click(self, session):
+        if self.shared is None:
+            return None
+        return self.shared.get(f'latest-click:{session}')
+
+    def record_click(self, session, click):
+        # The newest click of a session, for the other processes to see
+        if self.shared is None:
+            return
+        key = f'latest-click:{session}'
+        with self.shared.transact():
+            if click > self.shared.get(key, -1):
+                self.shared.set(key, click, expire=24 * 3600)
+
+    def superseded(self, query):
+        if query['session'] is None:
+            return False
+        latest = self.latest_click(query['session'])
+        return latest is not None and latest > query['click']
+
+    def interrupt(self, query, reason):
+        # Called with the lock held, for a query that is still registered
+        if query['reason'] is None:
+            query['reason'] = reason
+            query['cursor'].interrupt()
+
+    def watch(self):
+        # Interrupts the queries past their deadline or superseded in another process
+        while True:
+            time.sleep(self.poll_seconds)
+            now = time.monotonic()
+            with self.lock:
+                queries = list(self.running.items())
+            for key, query in queries:
+                if now > query['deadline']:
+                    reason = 'timed out'
+                elif self.superseded(query):
+                    reason = 'superseded'
+                else:
+                    continue
+                with self.lock:
+                    if key in self.running:
+                        self.interrupt(query, reason)
+
+    @contextmanager
+    def track(self, cursor, session, click):
+        # Runs the queries of the block on cursor as the session's click.
+        # Raises QueryInterrupted when they are stopped.
+        query = {'cursor': cursor, 'session': session, 'click': click,
+                 'deadline': time.monotonic() + self.timeout_seconds, 'reason': None}
+        if session is not None:
+            self.record_click(session, click)
+        with self.lock:
+            if session is not None:
+                for other in self.running.values():
+                    if other['session'] == session and other['click'] < click:
+                        self.interrupt(other, 'superseded')
+            self.running[id(query)] = query
+            # Threads don't survive a fork, so a forked worker starts its own monitor
+            if self.monitor is None or not self.monitor.is_alive():
+                self.monitor = threading.Thread(target=self.watch, name='query-monitor', daemon=True)
+                self.monitor.start()
+        try:
+            # A newer click may have started its query before this one did
+            if self.superseded(query):
+                raise QueryInterrupted('superseded')
+            yield
+        except duckdb.InterruptException:
+            raise QueryInterrupted(query['reason'] or 'interrupted') from None
+        finally:
+            with self.lock:
+                del self.running[id(query)]
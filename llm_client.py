@@ -0,0 +1,39 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# HTTP client for the LLM endpoint.
+# One keep-alive session per process pools the connections, so a request
+# reuses an open TLS connection instead of redoing the handshake. Every
+# request has a connect and a read timeout, and failed connections and
+# transient server errors are retried a bounded number of times with backoff.
+# The dashboard's background callbacks run in worker processes, which get a
+# copy of the session from the dashboard process. The dashboard process never
+# sends LLM requests itself, so that copy has no connections open yet.
+
+def llm_session(retries, pool_size):
+    # Read timeouts aren't retried: the model may still be generating, and
+    # sending the request again would multiply the wait
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['POST'],  # the chat completion request has no side effects
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def chat_completion(session, url, headers, data, connect_timeout, read_timeout):
+    # Content of the first choice of an OpenAI-compatible chat completion
+    response = session.post(url, headers=headers, json=data, timeout=(connect_timeout, read_timeout))
+    print(f"Response status code: {response.status_code}")
+    print(f"Response content: {response.text}")
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
@@ -0,0 +1,89 @@
+import duckdb
+import hashlib
+import re
+import threading
+
+# On-disk cache of the LLM's answers to the dashboard's questions.
+# Entries are keyed by the normalized question, the version of the prompt
+# template and the model, so an edited prompt or another model never gets an
+# answer generated for the old one. Entries expire after ttl_hours, and past
+# max_entries the least recently used ones are evicted.
+# The cache is its own DuckDB file, because the dashboard opens claims.duckdb
+# read-only. It is opened for each lookup, so the file isn't locked between
+# requests. A lookup that finds the file locked by another process (e.g.
+# another background callback) is treated as a miss.
+
+def normalize_question(question):
+    # Questions differing only in case or whitespace share an entry
+    return re.sub(r'\s+', ' ', question).strip().lower()
+
+def prompt_version(*template_parts):
+    # Version of a prompt template: a hash of its text
+    digest = hashlib.sha256()
+    for part in template_parts:
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+class LlmSqlCache:
+    def __init__(self, path, ttl_hours, max_entries):
+        self.path = path
+        self.ttl_hours = ttl_hours
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        with open('sql/llm_sql_cache.sql', 'r') as file:
+            self.ddl = file.read()
+
+    def connect(self):
+        conn = duckdb.connect(self.path)
+        conn.execute(self.ddl)
+        return conn
+
+    def get(self, question, version, model):
+        # The cached response for the question, or None
+        with self.lock:
+            try:
+                conn = self.connect()
+            except duckdb.IOException as e:
+                print(f"LLM SQL cache unavailable: {e}")
+                return None
+            try:
+                conn.execute(
+                    f"DELETE FROM llm_sql_cache WHERE created_at < current_localtimestamp() - INTERVAL {int(self.ttl_hours)} HOUR"
+                )
+                key = [normalize_question(question), version, model]
+                row = conn.execute("""
+                    SELECT response FROM llm_sql_cache
+                    WHERE question = ? AND prompt_version = ? AND model = ?
+                """, key).fetchone()
+                if row:
+                    conn.execute("""
+                        UPDATE llm_sql_cache SET last_used_at = current_localtimestamp()
+                        WHERE question = ? AND prompt_version = ? AND model = ?
+                    """, key)
+            finally:
+                conn.close()
+        return row[0] if row else None
+
+    def put(self, question, version, model, response):
+        with self.lock:
+            try:
+                conn = self.connect()
+            except duckdb.IOException as e:
+                print(f"LLM SQL cache unavailable: {e}")
+                return
+            try:
+                conn.execute("""
+                    INSERT OR REPLACE INTO llm_sql_cache
+                        (question, prompt_version, model, response, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, current_localtimestamp(), current_localtimestamp())
+                """, [normalize_question(question), version, model, response])
+                # Entries used before the max_entries-th most recently used one
+                conn.execute("""
+                    DELETE FROM llm_sql_cache WHERE last_used_at < (
+                        SELECT last_used_at FROM llm_sql_cache
+                        ORDER BY last_used_at DESC
+                        LIMIT 1 OFFSET ?
+                    )
+                """, [max(self.max_entries - 1, 0)])
+            finally:
+                conn.close()
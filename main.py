@@ -1,32 +1,87 @@
 import subprocess
+import sys
+import duckdb
+from pipeline import Stage, run_pipeline
+import create_claims_db
+import state_data_import
+import gender_data_import
+import claims_data_import
+import bene_data_import
+import parquet_export
+import icd_codes_import
+import icd_description_import
+import icd_procedures_import
+import icd10_hierarchy
+import claim_codes
+import identify_readmissions
+import calc_readmission_rate
+import chart
+import dashboard_snapshot
 
-def run_script(script_name):
-    print(f"\nRunning {script_name}...")
-    result = subprocess.run(['python', script_name], capture_output=True, text=True)
-    print("Output:")
-    print(result.stdout)
-    if result.returncode != 0:
-        print(f"Error running {script_name}:")
-        print(result.stderr)
-        exit(1)
-    print(f"{script_name} completed successfully.")
+def build_stages(argv):
+    import_options = {
+        'extract': '--extract' in argv,
+        'full_reload': '--full' in argv,
+        'sort': '--no-sort' not in argv
+    }
+    stages = [
+        Stage("create_claims_db", create_claims_db.run,
+              inputs=["create_claims_db.py", "sql"]),
+        Stage("state_data_import", state_data_import.run, deps=["create_claims_db"],
+              inputs=["state_data_import.py", "data/state"]),
+        Stage("gender_data_import", gender_data_import.run, deps=["create_claims_db"],
+              inputs=["gender_data_import.py"]),
+        Stage("claims_data_import", claims_data_import.run, deps=["create_claims_db"],
+              inputs=["claims_data_import.py", "csv_loader.py", "clinical_rules.py", "data/inpatient"], options=import_options),
+        Stage("bene_data_import", bene_data_import.run, deps=["create_claims_db"],
+              inputs=["bene_data_import.py", "csv_loader.py", "data/bene"], options=import_options),
+        Stage("icd_codes_import", icd_codes_import.run, deps=["claim_codes"],
+              inputs=["icd_codes_import.py", "icd10_hierarchy.py", "incremental.py", "data/icd/gem_i9diag.txt"],
+              options={'full_refresh': '--full' in argv}),
+        Stage("icd_procedures_import", icd_procedures_import.run, deps=["claim_codes"],
+              inputs=["icd_procedures_import.py", "icd_codes_import.py", "incremental.py", "data/icd/gem_i9pcs.txt"],
+              options={'full_refresh': '--full' in argv}),
+        Stage("icd_description_import", icd_description_import.run, deps=["create_claims_db"],
+              inputs=["icd_description_import.py", "data/icd/icd10cm-codes-April-2025.txt"]),
+        Stage("icd10_hierarchy", icd10_hierarchy.run, deps=["icd_description_import", "icd_codes_import"],
+              inputs=["icd10_hierarchy.py"]),
+        Stage("claim_codes", claim_codes.run, deps=["claims_data_import"],
+              inputs=["claim_codes.py", "clinical_rules.py", "incremental.py"],
+              options={'full_refresh': '--full' in argv}),
+        Stage("identify_readmissions", identify_readmissions.run, deps=["claims_data_import"],
+              inputs=["identify_readmissions.py", "incremental.py"],
+              options={'full_refresh': '--full' in argv}),
+        Stage("calc_readmission_rate", calc_readmission_rate.run,
+              deps=["claims_data_import", "bene_data_import", "claim_codes", "icd_procedures_import"],
+              inputs=["calc_readmission_rate.py", "readmission_engine.py", "clinical_rules.py"]),
+        Stage("chart", chart.run, deps=["calc_readmission_rate", "state_data_import"],
+              inputs=["chart.py", "shapefiles"], outputs=["us_readmission_rates.png", "us_col_chart.png"]),
+    ]
+
+    # Optionally stage claims and beneficiaries as partitioned Parquet
+    if '--parquet' in argv:
+        stages.append(Stage("parquet_export", parquet_export.run,
+                            deps=["claims_data_import", "bene_data_import"],
+                            inputs=["parquet_export.py"], outputs=["staging"]))
+    return stages
 
 if __name__ == "__main__":
-    scripts = [
-        "create_claims_db.py",
-        "state_data_import.py",
-        "gender_data_import.py",
-        "claims_data_import.py",
-        "bene_data_import.py",
-        "identify_readmissions.py",
-        "calc_readmission_rate.py",
-        "chart.py",
-        "icd_codes_import.py",
-        "icd_description_import.py",
-        "plotly_dashboard_ai.py"
-    ]
+    conn = duckdb.connect('claims.duckdb')
+    try:
+        success = run_pipeline(conn, build_stages(sys.argv), force='--force' in sys.argv)
+        # The dashboard's default view, stamped with the data version the
+        # completed run leaves behind
+        if success:
+            dashboard_snapshot.run(conn)
+    finally:
+        conn.close()
 
-    for script in scripts:
-        run_script(script)
+    if not success:
+        print("\nThe pipeline stopped because a stage failed.")
+        exit(1)
+    print("\nAll stages have been executed successfully.")
 
-    print("\nAll scripts have been executed successfully.")
+    # The dashboard is a long-running server, so it runs on its own after the pipeline
+    if '--no-dashboard' not in sys.argv:
+        print("\nStarting plotly_dashboard_ai.py...")
+        subprocess.run([sys.executable, 'plotly_dashboard_ai.py'])
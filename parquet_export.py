@@ -0,0 +1,97 @@
+import duckdb
+import os
+import shutil
+
+# Optional staging step: export claims and beneficiaries to Hive-partitioned
+# Parquet under ./staging, partitioned by year and state. Queries that read
+# the files only touch the partitions and columns they need, and any number of
+# processes can read them without holding the claims.duckdb lock.
+
+staging_folder = './staging'
+row_group_size = 122880
+
+# Year of a beneficiary summary file, e.g. DE1_0_2008_Beneficiary_Summary_File_Sample_1.csv
+summary_year = "TRY_CAST(regexp_extract(SOURCE_FILE, '_(20[0-9][0-9])_', 1) AS INTEGER)"
+
+exports = {
+    # Claims are partitioned by admission year and by the beneficiary's state in
+    # the summary file for that year (or any summary if that year is missing)
+    'inpatient_claims': (f"""
+        WITH bene_state AS (
+            SELECT
+                DESYNPUF_ID,
+                {summary_year} AS summary_year,
+                SP_STATE_CODE
+            FROM beneficiary_summary
+        ),
+        any_state AS (
+            SELECT DESYNPUF_ID, MIN(SP_STATE_CODE) AS SP_STATE_CODE
+            FROM beneficiary_summary
+            GROUP BY DESYNPUF_ID
+        )
+        SELECT
+            c.*,
+            EXTRACT(YEAR FROM c.CLM_ADMSN_DT) AS ADMSN_YEAR,
+            COALESCE(bs.SP_STATE_CODE, a.SP_STATE_CODE) AS SP_STATE_CODE
+        FROM inpatient_claims c
+        LEFT JOIN bene_state bs
+            ON c.DESYNPUF_ID = bs.DESYNPUF_ID
+            AND EXTRACT(YEAR FROM c.CLM_ADMSN_DT) = bs.summary_year
+        LEFT JOIN any_state a ON c.DESYNPUF_ID = a.DESYNPUF_ID
+        ORDER BY c.DESYNPUF_ID, c.CLM_ADMSN_DT
+    """, ['ADMSN_YEAR', 'SP_STATE_CODE']),
+    'beneficiary_summary': (f"""
+        SELECT *, {summary_year} AS SUMMARY_YEAR
+        FROM beneficiary_summary
+        ORDER BY DESYNPUF_ID
+    """, ['SUMMARY_YEAR', 'SP_STATE_CODE'])
+}
+
+# Partition column types, so state codes aren't read back as numbers
+partition_types = {
+    'inpatient_claims': {'ADMSN_YEAR': 'INTEGER', 'SP_STATE_CODE': 'VARCHAR'},
+    'beneficiary_summary': {'SUMMARY_YEAR': 'INTEGER', 'SP_STATE_CODE': 'VARCHAR'}
+}
+
+def parquet_source(table_name, folder=staging_folder):
+    # FROM clause for reading a staged table with partition pruning
+    hive_types = ', '.join(f"'{name}': '{sql_type}'" for name, sql_type in partition_types[table_name].items())
+    path = os.path.join(folder, table_name, '**', '*.parquet')
+    return f"read_parquet('{path}', hive_partitioning=true, hive_types={{{hive_types}}})"
+
+def export_table(conn, table_name, query, partition_by):
+    # Write to a temporary folder and swap it in, so readers never see a half-written export
+    target = os.path.join(staging_folder, table_name)
+    temp_target = target + '.tmp'
+    if os.path.exists(temp_target):
+        shutil.rmtree(temp_target)
+    os.makedirs(staging_folder, exist_ok=True)
+
+    conn.execute(f"""
+        COPY ({query}) TO '{temp_target}'
+        (FORMAT PARQUET, PARTITION_BY ({', '.join(partition_by)}),
+         ROW_GROUP_SIZE {row_group_size}, COMPRESSION ZSTD)
+    """)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(temp_target, target)
+
+    row_count = conn.execute(f"SELECT COUNT(*) FROM {parquet_source(table_name)}").fetchone()[0]
+    partition_count = sum(1 for _, dirs, files in os.walk(target) if files)
+    print(f"Exported {row_count} rows of {table_name} to {target} in {partition_count} partitions")
+
+def run(conn):
+    try:
+        for table_name, (query, partition_by) in exports.items():
+            export_table(conn, table_name, query, partition_by)
+    except Exception as e:
+        print(f"Error exporting data: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    conn = duckdb.connect('claims.duckdb', read_only=True)
+    try:
+        run(conn)
+    finally:
+        conn.close()
+        print("Database connection closed.")
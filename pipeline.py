@@ -0,0 +1,143 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# In-process DAG runner for the pipeline stages.
+# Every stage runs on its own cursor of one shared DuckDB connection, stages
+# whose dependencies are done run concurrently, and a stage is skipped when its
+# inputs, options and upstream stages haven't changed since its last successful
+# run (recorded in pipeline_runs).
+
+class Stage:
+    def __init__(self, name, run, deps=(), inputs=(), outputs=(), options=None):
+        self.name = name
+        self.run = run              # called as run(conn, **options)
+        self.deps = list(deps)      # names of stages that must finish first
+        self.inputs = list(inputs)  # files or folders the stage reads
+        self.outputs = list(outputs)  # files or folders the stage writes, besides the database
+        self.options = options or {}
+
+def path_signature(path):
+    # Size and modification time of a file, or of every file under a folder
+    if os.path.isdir(path):
+        signatures = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            signatures.extend(path_signature(os.path.join(root, f)) for f in sorted(files))
+        return '\n'.join(signatures)
+    if not os.path.exists(path):
+        return f"{path}:missing"
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def stage_fingerprint(stage, fingerprints):
+    digest = hashlib.sha256()
+    for path in stage.inputs:
+        digest.update(path_signature(path).encode('utf-8'))
+    digest.update(repr(sorted(stage.options.items())).encode('utf-8'))
+    for dep in stage.deps:
+        digest.update(fingerprints[dep].encode('utf-8'))
+    return digest.hexdigest()
+
+def topological_order(stages):
+    by_name = {stage.name: stage for stage in stages}
+    order, visiting, done = [], set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name not in by_name:
+            raise ValueError(f"Unknown stage {name} (needed by {path[-1]})")
+        if name in visiting:
+            raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+        order.append(by_name[name])
+
+    for stage in stages:
+        visit(stage.name, [])
+    return order
+
+def run_stage(conn, stage):
+    # Runs in a worker thread, on a cursor of its own
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    try:
+        stage.run(cursor, **stage.options)
+    finally:
+        cursor.close()
+    return time.perf_counter() - start
+
+def print_summary(order, results):
+    print("\nStage                       | Status    | Seconds")
+    print("-" * 50)
+    for stage in order:
+        status, seconds = results.get(stage.name, ('not run', 0.0))
+        print(f"{stage.name:27} | {status:9} | {seconds:7.2f}")
+    print("-" * 50)
+    print(f"{'Total stage time':27} | {'':9} | {sum(s for _, s in results.values()):7.2f}")
+
+def run_pipeline(conn, stages, force=False, max_workers=4):
+    # Run the stages in dependency order. Returns True if no stage failed.
+    with open('sql/pipeline_runs.sql', 'r') as file:
+        conn.execute(file.read())
+
+    order = topological_order(stages)
+    fingerprints = {}
+    for stage in order:
+        fingerprints[stage.name] = stage_fingerprint(stage, fingerprints)
+    previous = dict(conn.execute("SELECT stage, fingerprint FROM pipeline_runs").fetchall())
+
+    results = {}  # stage name -> (status, seconds)
+    pending = list(order)
+    running = {}  # future -> stage
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for stage in list(pending):
+                dep_status = [results[dep][0] for dep in stage.deps if dep in results]
+                if any(status in ('failed', 'blocked') for status in dep_status):
+                    pending.remove(stage)
+                    results[stage.name] = ('blocked', 0.0)
+                elif len(dep_status) == len(stage.deps):
+                    pending.remove(stage)
+                    up_to_date = (
+                        not force
+                        and previous.get(stage.name) == fingerprints[stage.name]
+                        and all(status == 'skipped' for status in dep_status)
+                        and all(os.path.exists(path) for path in stage.outputs)
+                    )
+                    if up_to_date:
+                        print(f"\n{stage.name} is up to date, skipping.")
+                        results[stage.name] = ('skipped', 0.0)
+                    else:
+                        print(f"\nRunning {stage.name}...")
+                        running[pool.submit(run_stage, conn, stage)] = stage
+
+            # Skipped stages may have made more stages ready
+            if any(all(dep in results for dep in stage.deps) for stage in pending):
+                continue
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    print(f"Error running {stage.name}: {str(e)}")
+                    results[stage.name] = ('failed', 0.0)
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO pipeline_runs VALUES (?, ?, current_timestamp, ?)",
+                    [stage.name, fingerprints[stage.name], seconds]
+                )
+                print(f"{stage.name} completed successfully in {seconds:.2f}s.")
+                results[stage.name] = ('done', seconds)
+
+    print_summary(order, results)
+    return all(status in ('done', 'skipped') for status, _ in results.values())
@@ -1,11 +1,26 @@
-from dash import dcc, html, Dash, dash_table, Output, Input, State, ctx, no_update, clientside_callback
+from dash import dcc, html, Dash, dash_table, Output, Input, State, ctx, clientside_callback, DiskcacheManager, no_update
+from dash.exceptions import PreventUpdate
+import diskcache
 import duckdb
-import plotly.express as px
+import plotly.io as pio
 import os
 import re
 import math
+import uuid
+import threading
 import pandas as pd
-import requests
+from llm_client import llm_session, chat_completion
+from icd10_hierarchy import prefix_filters_to_ranges
+from result_cache import ResultCache
+from llm_sql_cache import LlmSqlCache, prompt_version
+from duckdb_pool import ConnectionPool
+from inflight_queries import InflightQueries, QueryInterrupted
+from sql_guard import guard_generated_sql, validate_select, sample_beneficiaries, RejectedQuery
+from code_sets import CodeSets
+from icd_search import LazyIcdSearchIndex
+from table_pages import fetch_page
+from dashboard_figures import readmission_rates, create_choropleth_map, create_column_chart, default_figures
+from dashboard_snapshot import BaselineSnapshot, all_claims_query, code_list_queries
 
 proxy_url = os.getenv('LLM_API_URL') 
 api_key = os.getenv('LLM_API_KEY')
@@ -50,16 +65,35 @@ prompt_p2 = """Please generate a DuckDB-compatible SQL query that select all cla
             SELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE ...
             $$$
             """
-conn = duckdb.connect(database="claims.duckdb", read_only=True)
+llm_model = "franklin"
+# Pooled keep-alive session with timeouts and bounded retries for LLM requests
+llm_requests = llm_session(retries=int(os.getenv('LLM_RETRIES', '2')), pool_size=10)
+llm_connect_timeout = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+llm_read_timeout = float(os.getenv('LLM_READ_TIMEOUT', '60'))
+# Generated SQL by question, prompt template and model, so repeated
+# questions skip the LLM round-trip
+llm_sql_cache = LlmSqlCache(os.getenv('LLM_CACHE_FILE', 'llm_cache.duckdb'),
+                            ttl_hours=int(os.getenv('LLM_CACHE_TTL_HOURS', '168')),
+                            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000')))
+llm_prompt_version = prompt_version(prompt_p1, prompt_p2)
+# Generated SQL filtering on the diagnosis code only is resolved once into a
+# code set, which the claims are semi-joined with (see code_sets.py). The sets
+# live in a database attached to each connection of the pool.
+code_sets = CodeSets("INPATIENT_CLAIMS_ICD10", max_sets=int(os.getenv('DASHBOARD_CODE_SETS', '256')))
+# Query results by SQL and data version, bounded to DASHBOARD_CACHE_MB
+result_cache = ResultCache(int(os.getenv('DASHBOARD_CACHE_MB', '64')) * 1024 * 1024)
+# Default view written by the pipeline (see dashboard_snapshot.py), read on
+# first use and used while the data hasn't changed since
+baseline = BaselineSnapshot()
 light_bg_color = '#f8f9fa'
-light_text_color = '#333'
-init_launch = 0
-icd_top_level_grp_cnt = 0
-init_min = 0
-init_max = 0.1 # Adjusted for fractional rate (0-1)
             
-def fetch_data(top_n=None, sqlstmt=None):
-        query = """
+def state_rates_query(claims_sql):
+    # Readmissions and admissions by state of the claims of claims_sql.
+    # Planned transplants are excluded like in the readmission_rate cube of the
+    # default view (see readmission_engine.py): a claim with the transplant flag
+    # on any of its rows isn't an index admission, but still precedes the next
+    # claim. Claims admitted on the same day are ordered by CLM_ID and SEGMENT.
+    return """
         SELECT
             s.state_abbr as State,
             SUM(rr.readmissions) as "Total Readmissions",
@@ -71,8 +105,9 @@ def fetch_data(top_n=None, sqlstmt=None):
                     ic.CLM_ID,
                     ic.DESYNPUF_ID,
                     ic.CLM_ADMSN_DT,
-                    LAG(ic.NCH_BENE_DSCHRG_DT) OVER (PARTITION BY ic.DESYNPUF_ID ORDER BY ic.CLM_ADMSN_DT) AS prev_discharge_date
-                FROM """ + " ( " + f"{sqlstmt}" + " ) as ic " + """
+                    ic.CLM_ID IN (SELECT CLM_ID FROM inpatient_claims WHERE TRANSPLANT_FLAG) AS is_planned_transplant,
+                    LAG(ic.NCH_BENE_DSCHRG_DT) OVER (PARTITION BY ic.DESYNPUF_ID ORDER BY ic.CLM_ADMSN_DT, ic.CLM_ID, ic.SEGMENT) AS prev_discharge_date
+                FROM """ + " ( " + f"{claims_sql}" + " ) as ic " + """
                 WHERE EXTRACT(YEAR FROM ic.CLM_ADMSN_DT) IN (2008, 2009, 2010)
             )
             SELECT
@@ -87,6 +122,7 @@ def fetch_data(top_n=None, sqlstmt=None):
                 all_cause_readmission acr ON vc.CLM_ID = acr.CLM_ID
             WHERE
                 (vc.CLM_ADMSN_DT - vc.prev_discharge_date > 30 OR vc.prev_discharge_date IS NULL)
+                AND NOT vc.is_planned_transplant
             GROUP BY
                 bs.SP_STATE_CODE
             ) rr
@@ -96,82 +132,179 @@ def fetch_data(top_n=None, sqlstmt=None):
             s.state_abbr
         """
 
-        result = conn.execute(query).fetchdf()
+# The state rates of a code set's claims, whole or over a sample of the
+# beneficiaries, as statements with the set id and the sample as bound
+# parameters: only those vary, so every search runs the same statement text
+# (the window over the claims, the beneficiary and readmission joins, the
+# state aggregation) with nothing spliced into it. DuckDB's EXECUTE doesn't
+# take bound parameters, so they aren't PREPAREd per cursor.
+code_set_statements = {
+    'state_rates_code_set': state_rates_query(code_sets.claims_query(None, '$1::VARCHAR')),
+    'state_rates_code_set_sample': state_rates_query(
+        sample_beneficiaries(code_sets.claims_query(None, '$1::VARCHAR'), '$2::UBIGINT')),
+}
 
-        # Calculate Readmission Rate (Removed redundant Pandas groupby)
-        # Calculate Readmission Rate as a fraction (0 to 1) for consistency
-        # Calculate Readmission Rate as a fraction (0 to 1) - removed rounding
-        result['Readmission Rate'] = result['Total Readmissions'] / result['Total Admissions']
+# Read-only connection per process with a cursor per request, so concurrent
+# callbacks run their queries side by side. DASHBOARD_DUCKDB_THREADS bounds
+# the threads of each query (all cores by default).
+duckdb_threads = os.getenv('DASHBOARD_DUCKDB_THREADS')
+db_pool = ConnectionPool("claims.duckdb", threads=int(duckdb_threads) if duckdb_threads else None,
+                         on_connect=code_sets.attach)
+
+def fetch_data(top_n=None, sqlstmt=None, session=None, click=0, set_id=None, sample_every=1):
+        # sqlstmt None: all claims, from the baseline snapshot or the
+        # readmission_rate cube.
+        # A code set runs as its statement instead of sqlstmt.
+        if set_id is not None and sample_every > 1:
+            query, params = code_set_statements['state_rates_code_set_sample'], [set_id, int(sample_every)]
+        elif set_id is not None:
+            query, params = code_set_statements['state_rates_code_set'], [set_id]
+        else:
+            query, params = (all_claims_query if sqlstmt is None else state_rates_query(sqlstmt)), None
+
+        with db_pool.cursor() as cursor, inflight_queries.track(cursor, session, click):
+            result = baseline.state_rates(cursor) if query is all_claims_query else None
+            if result is None:
+                result = result_cache.fetchdf(cursor, query, params)
 
         # Sort and limit if needed
-        result = result.sort_values('Readmission Rate', ascending=False)
+        result = readmission_rates(result)
         if top_n:
             result = result.head(top_n)
 
         return result
 
-min_value = init_min
-max_value = init_max
-app = Dash(__name__, assets_folder='assets')
-
-def create_column_chart(data):
-    fig = px.bar(data, x='State', y='Readmission Rate', 
-          title='Top 10 States by Readmission Rate'
-     )
-    fig.update_layout(
-        title_x=0.5,
-        xaxis_title='State',
-        yaxis_title='Readmission Rate', # Removed (%) as rate is now fractional
-        xaxis=dict(
-          showgrid=True,  
-          gridcolor='#c8c8c8 ', 
-          title='State',
-          title_font=dict(size=14, color='#787878'), 
-          tickfont=dict(size=12, color='#646464'),
-        ),
-        margin=dict(l=10, r=10, t=60, b=10),
-        template="plotly_white", 
-        font=dict(color="#333"), 
-        plot_bgcolor="#eee", 
-        paper_bgcolor="#eee",
-        font_color=light_text_color
-    )
-    return fig
-
-def create_choropleth_map(data):
-    fig = px.choropleth(
-        data,
-        locations='State',
-        locationmode='USA-states',
-        color='Readmission Rate',
-        scope="usa",
-        color_continuous_scale="Cividis",
-        range_color=[min_value, max_value],
-        title='US Readmission Rates by State',
-        labels={'Readmission Rate': 'Readmission Rate'} # Removed (%) as rate is now fractional
-    )
-    fig.update_layout(
-        geo_scope='usa',
-        title_x=0.5,
-        margin=dict(l=10, r=10, t=60, b=10),
-        geo=dict(bgcolor="#eee"),
-        template="plotly_white", 
-        font=dict(color="#333"), 
-        plot_bgcolor="white", 
-        paper_bgcolor="#eee",
-        font_color=light_text_color
-    )
-    return fig
+# LLM requests run as background callbacks in worker processes, so a slow
+# generation doesn't hold up other users' requests
+dash_cache = diskcache.Cache("./dash_cache")
+background_manager = DiskcacheManager(dash_cache)
+# Running queries by session: a new search interrupts the session's previous
+# one, and no query runs longer than DASHBOARD_QUERY_TIMEOUT seconds
+query_timeout = float(os.getenv('DASHBOARD_QUERY_TIMEOUT', '30'))
+inflight_queries = InflightQueries(query_timeout, shared=dash_cache)
+# Generated SQL may only read the claims, and runs as a sampled preview when
+# its estimated cost is over DASHBOARD_MAX_QUERY_COST rows
+generated_sql_tables = ["INPATIENT_CLAIMS_ICD10"]
+max_query_cost = int(os.getenv('DASHBOARD_MAX_QUERY_COST', '5000000'))
+# Search over the ICD-10-CM descriptions, which answers questions naming a
+# condition without asking the LLM
+icd_index = LazyIcdSearchIndex(db_pool)
+# Callback responses, figures and table pages, are serialized with orjson
+pio.json.config.default_engine = "orjson"
+app = Dash(__name__, assets_folder='assets', background_callback_manager=background_manager)
+# WSGI entry point, e.g. gunicorn --workers 4 plotly_dashboard_ai:server
+server = app.server
 
-noneicdcodequery = "SELECT icd10_cm_code, description FROM main.icd10_diag_desc where icd10_cm_code like 'NONE%' order by icd10_cm_code"
-noneicdcodedf = conn.execute(noneicdcodequery).fetchdf() 
 errornoicdcodedf = pd.DataFrame({
     'icd10_cm_code': ['**MESSAGE**'],
     'description': ['You have not specified conditions or the conditions are too broad. Please try again with more specific search criteria.']
 })
-icdcodedf = noneicdcodedf
 
-app.layout = html.Div([
+def parse_llm_sql(msg):
+    # The generated SQL, its WHERE clause and the number of distinct code groups it filters on
+    match_found = re.search(r"\${3}(.*)\${3}",msg,re.DOTALL)
+    franklin_sql = re.sub(r"[ \t\n;]+"," ",re.sub(r'--.*',"", match_found.group(1)))
+    where_clause_match = re.search(r"where\s+(.+)", franklin_sql, re.IGNORECASE)
+    # No WHERE clause: every code
+    where_clause = where_clause_match.group(0) if where_clause_match else ""
+    icd_codes = re.findall(r"ICD10_DGNS_CODE LIKE '([A-Z]\d{1,3})%'", where_clause)
+    return franklin_sql, where_clause, len(set(icd_codes))
+
+def fetch_icd_codes(where_clause, set_id=None, session=None, click=0):
+    # The codes of the code set, or of the WHERE clause with its code prefix
+    # filters run as code number ranges (see icd10_hierarchy.py). The WHERE
+    # clause only passed guard_sql as part of the claims query, so the codes
+    # query is validated too; a clause that doesn't fit the codes raises
+    # duckdb.Error.
+    icdcodequery = code_sets.codes_query() if set_id is not None else ("SELECT icd10_cm_code, description FROM "
+                    "(SELECT icd10_cm_code, code_num AS ICD10_DGNS_NUM, description "
+                    "FROM main.icd10_hierarchy WHERE description IS NOT NULL) as c " +
+                    prefix_filters_to_ranges(where_clause, "ICD10_DGNS_CODE", "ICD10_DGNS_NUM").replace("ICD10_DGNS_CODE","icd10_cm_code"))
+    with db_pool.cursor() as cursor, inflight_queries.track(cursor, session, click):
+        if set_id is None:
+            validate_select(cursor, icdcodequery, generated_sql_tables + ["icd10_hierarchy"])
+            return result_cache.fetchdf(cursor, icdcodequery)
+        return result_cache.fetchdf(cursor, icdcodequery, [set_id])
+
+def guard_sql(sql):
+    # The claims query to run for generated SQL, one in how many beneficiaries
+    # it covers (see sql_guard.py), and its code set if it has one
+    with db_pool.cursor() as cursor:
+        checked_sql, sample_every = guard_generated_sql(cursor, sql, generated_sql_tables, max_query_cost)
+        set_id = code_sets.resolve(cursor, sql, result_cache.data_version(cursor))
+    if set_id is not None:
+        checked_sql = sample_beneficiaries(code_sets.claims_query(set_id), sample_every)
+    return checked_sql, sample_every, set_id
+
+def code_set_of(sql, set_id):
+    # The code set of generated SQL that guard_sql gave set_id. Sets live in
+    # each process, so a set another worker resolved, or one dropped since, is
+    # resolved again here; that doesn't estimate the cost of the SQL, which
+    # guard_sql checked before it was stored (see store_source).
+    if set_id is None:
+        return None
+    with db_pool.cursor() as cursor:
+        data_version = result_cache.data_version(cursor)
+        if code_sets.stored(str(set_id), data_version):
+            return str(set_id)
+        return code_sets.resolve(cursor, sql, data_version)
+
+# What the tables page through, the generated SQL as guard_sql checked it
+# with its code set and sample, is kept on the server in the cache the worker
+# processes share. The browser only gets an opaque id of it, as SQL or a
+# sample it sent back would skip guard_sql's checks.
+source_ttl = int(os.getenv('DASHBOARD_SOURCE_TTL_HOURS', '24')) * 3600
+
+def store_source(source):
+    source_id = uuid.uuid4().hex
+    dash_cache.set(f"table-source:{source_id}", source, expire=source_ttl)
+    return source_id
+
+def stored_source(source_id):
+    # The source stored under source_id, or None when it's unknown or expired
+    if not isinstance(source_id, str):
+        return None
+    return dash_cache.get(f"table-source:{source_id}")
+
+def state_rates(source_id):
+    # The state rates of the state table's source, or of all claims for None.
+    # Its code set and sample were worked out by guard_sql when the search
+    # ran, so a page doesn't estimate the cost again.
+    if source_id is None:
+        return fetch_data()
+    source = stored_source(source_id)
+    if source is None:
+        raise RejectedQuery("The search is no longer available")
+    set_id = code_set_of(source["claims_filter"], source["set_id"])
+    return fetch_data(sqlstmt=source["checked_sql"], set_id=set_id, sample_every=source["sample_every"])
+
+def no_codes_table():
+    # Codes the ICD code table lists before a search has run
+    with db_pool.cursor() as cursor:
+        codes = baseline.code_list(cursor, 'none')
+        return codes if codes is not None else result_cache.fetchdf(cursor, code_list_queries['none'])
+
+def default_view(message):
+    # All claims, with a message in the SQL box. The figures are the
+    # snapshot's prebuilt ones while it is current.
+    all_states_data = fetch_data()
+    with db_pool.cursor() as cursor:
+        snapshot = baseline.current(cursor)
+    if snapshot is not None:
+        choropleth, column_chart = snapshot['figures']['choropleth'], snapshot['figures']['column_chart']
+    else:
+        choropleth, column_chart = default_figures(all_states_data)
+    return (
+      choropleth,
+      column_chart,
+      [{"name": i, "id": i} for i in all_states_data.columns],
+      None,
+      0,
+      False,
+      message
+    )
+
+dashboard_layout = html.Div([
     html.Div([
         html.H1('Accelerated Analysis - Readmission Rates by State', className="header-style")
     ], className="header-container"),
@@ -204,8 +337,14 @@ app.layout = html.Div([
               {"name": "ICD-10-CM Code", "id": "icd10_cm_code"},
               {"name": "Description", "id": "description"}
           ],
-          data=errornoicdcodedf.to_dict("records"),
+          page_action="custom",
+          page_current=0,
           page_size=20,
+          filter_action="custom",
+          filter_query="",
+          sort_action="custom",
+          sort_mode="multi",
+          sort_by=[],
           style_data_conditional=[
             {"if": {"row_index": "odd"}, "backgroundColor": "#f2f2f2"},
             {"if": {"row_index": "even"}, "backgroundColor": "#ffffff"}, 
@@ -238,10 +377,12 @@ app.layout = html.Div([
         dash_table.DataTable(
             id='table',
             editable=False,
-            filter_action="native",
-            sort_action="native",
+            filter_action="custom",
+            filter_query="",
+            sort_action="custom",
             sort_mode="multi",
-            page_action="native",
+            sort_by=[],
+            page_action="custom",
             page_current=0,
             page_size=10,
             style_table={'overflowX': 'auto'},
@@ -268,6 +409,14 @@ app.layout = html.Div([
             css=[{"selector": "table", "rule": "class: dash-table-container"}],
         )
     ], style={'width': '100%', 'marginTop': '20px'}),
+##Generated SQL the state table pages through, None for all claims
+    dcc.Store(id="table-source"),
+##What the ICD code table lists: the codes of an answer, or a message
+    dcc.Store(id="icd10-source"),
+##Question for the LLM, when the ICD-10 description search can't answer it
+    dcc.Store(id="llm-question"),
+##LLM answer for the last Update Data click
+    dcc.Store(id="llm-response"),
 ##Pop-up if search topic returns too many codes    
     dcc.ConfirmDialog(
         id = "popup-message",
@@ -276,99 +425,108 @@ app.layout = html.Div([
     )
   ], style={'backgroundColor':light_bg_color,'padding':'20px'})
 
+def serve_layout():
+    # Every page load is a session of its own, for tracking its queries
+    return html.Div([dcc.Store(id="session-id", data=str(uuid.uuid4())), dashboard_layout])
+
+app.layout = serve_layout
+
+##Answer from the ICD-10 description search, or pass the question on to the LLM
+@app.callback(
+    Output("llm-response", "data", allow_duplicate=True),
+    Output("llm-question", "data"),
+    Input("update-btn", "n_clicks"),
+    State("user-input", "value"),
+    prevent_initial_call=True
+)
+def resolve_question(n_clicks,user_input):
+    # n_clicks makes every click's answer a new value, even for the same question
+    if user_input is None or user_input.strip() == "":
+        return {"click": n_clicks, "question": None}, no_update
+    msg = icd_index.resolve(user_input)
+    if msg is None:
+        return no_update, {"click": n_clicks, "question": user_input}
+    print(f"Resolved from the ICD-10-CM descriptions: {user_input}")
+    return {"click": n_clicks, "question": user_input, "msg": msg}, no_update
+
+##Generate SQL for the user's question in the background
+@app.callback(
+    Output("llm-response", "data", allow_duplicate=True),
+    Input("llm-question", "data"),
+    background=True,
+    running=[(Output("update-btn", "disabled"), True, False)],
+    prevent_initial_call=True
+)
+def generate_sql(llm_question):
+    n_clicks = llm_question["click"]
+    user_input = llm_question["question"]
+    prompt = prompt_p1 + ' ' + user_input + ' ' + prompt_p2
+    data = {
+        "model": llm_model,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+    try:
+        msg = llm_sql_cache.get(user_input, llm_prompt_version, llm_model)
+        if msg is not None:
+            print(f"Using cached SQL for: {user_input}")
+        else:
+            print(f"Making request to: {proxy_url + op_url}")
+            print(f"Headers: {llm_headers}")
+            print(f"Data: {data}")
+            msg = chat_completion(llm_requests, proxy_url + op_url, llm_headers, data,
+                                  llm_connect_timeout, llm_read_timeout)
+            # Only answers with a SQL block are worth repeating
+            if re.search(r"\${3}(.*)\${3}",msg,re.DOTALL):
+                llm_sql_cache.put(user_input, llm_prompt_version, llm_model, msg)
+    except Exception as e:
+        print(f"Error making API request: {e}")
+        return {"click": n_clicks, "question": user_input, "error": str(e)}
+    return {"click": n_clicks, "question": user_input, "msg": msg}
+
 @app.callback(
    [
     Output('choropleth-map', 'figure'),
     Output('column-chart', 'figure'),
     Output('table', 'columns'),
-    Output('table', 'data'),
+    Output('table-source', 'data'),
+    Output('table', 'page_current'),
     Output("popup-message", "displayed"),
     Output("output-text", "children")
    ],
-    Input("update-btn", "n_clicks"),
-    Input("user-input", "value")
+    Input("llm-response", "data"),
+    State("session-id", "data")
 )
-def update_data(n_clicks,user_input):
-    global init_launch 
-    global icd_top_level_grp_cnt
-    global icdcodedf
-    global min_value
-    global max_value
-    inpatient_claims_source = """SELECT * FROM MAIN.INPATIENT_CLAIMS_ICD10"""
-    if n_clicks == 0 or init_launch == 0 or (
-                    ctx.triggered_id == "update-btn" and 
-                    (user_input is None or user_input.strip() == "")):
-        # Fetch data once for consistency
-        all_states_data = fetch_data(sqlstmt=inpatient_claims_source)
-
-        # Derive filtered_data and top_10_data from the single fetch
-        filtered_data = all_states_data.copy()
-        top_10_data = all_states_data.sort_values('Readmission Rate', ascending=False).head(10).copy()
-
-        # Debugging prints for CT and TN data
-        if init_launch == 0:
-           init_launch = -1
-        icdcodedf = errornoicdcodedf
-        min_value = init_min
-        max_value = init_max
-        return (
-         create_choropleth_map(filtered_data),
-         create_column_chart(top_10_data),
-         [{"name": i, "id": i} for i in filtered_data.columns],
-         filtered_data.to_dict('records'),
-         False,
-         f"You have not entered anything yet."
-        )
-    elif ctx.triggered_id == "update-btn":
-         prompt = prompt_p1 + ' ' + user_input + ' ' + prompt_p2
-         data = {
-             "model": "franklin",
-             "messages": [{"role": "user", "content": prompt}]
-         }
-         try:
-             print(f"Making request to: {proxy_url + op_url}")
-             print(f"Headers: {llm_headers}")
-             print(f"Data: {data}")
-             response = requests.post(
-                 proxy_url + op_url,
-                 headers=llm_headers,
-                 json=data)
-             print(f"Response status code: {response.status_code}")
-             print(f"Response content: {response.text}")
-             response.raise_for_status()
-             result = response.json()
-         except Exception as e:
-             print(f"Error making API request: {e}")
-             print(f"Response details: {response.text if 'response' in locals() else 'No response'}")
-             # Return default data on error
-             # Fetch data once for consistency on error as well
-             all_states_data = fetch_data(sqlstmt=inpatient_claims_source)
-             filtered_data = all_states_data.copy()
-             top_10_data = all_states_data.sort_values('Readmission Rate', ascending=False).head(10).copy()
-             return (
-               create_choropleth_map(filtered_data),
-               create_column_chart(top_10_data),
-               [{"name": i, "id": i} for i in filtered_data.columns],
-               filtered_data.to_dict('records'),
-               False,
-               f"Error making API request: {e}"
-             )
-         msg = result["choices"][0]["message"]["content"]
-         match_found = re.search(r"\${3}(.*)\${3}",msg,re.DOTALL)
-         franklin_sql = re.sub(r"[ \t\n;]+"," ",re.sub(r'--.*',"", match_found.group(1)))
-         where_clause_match = re.search(r"where\s+(.+)", franklin_sql, re.IGNORECASE)
-         where_clause = where_clause_match.group(0) if where_clause_match else "WHERE clause not found"
-         icd_codes = re.findall(r"ICD10_DGNS_CODE LIKE '([A-Z]\d{1,3})%'", where_clause)
-         icd_top_level_grp_cnt = len(set(icd_codes))
-         icdcodequery = "SELECT icd10_cm_code, description FROM main.icd10_diag_desc as c " + where_clause.replace("ICD10_DGNS_CODE","icd10_cm_code")
-         icdcodedf = conn.execute(icdcodequery).fetchdf()
+def update_data(llm_response, session_id):
+    inpatient_claims_source = None  # all claims
+    claims_filter, set_id, sample_every = None, None, 1
+    if llm_response is None or llm_response["question"] is None:
+        return default_view(f"You have not entered anything yet.")
+    elif "error" in llm_response:
+         # Return default data on error
+         return default_view(f"Error making API request: {llm_response['error']}")
+    else:
+         franklin_sql, where_clause, icd_top_level_grp_cnt = parse_llm_sql(llm_response["msg"])
+         sample_note = ""
          if icd_top_level_grp_cnt < 10:
-           inpatient_claims_source = franklin_sql
+           claims_filter = prefix_filters_to_ranges(franklin_sql, "ICD10_DGNS_CODE", "ICD10_DGNS_NUM")
+           try:
+             inpatient_claims_source, sample_every, set_id = guard_sql(claims_filter)
+           except RejectedQuery as e:
+             return default_view(f"The generated SQL was not run: {e}. {franklin_sql}")
+           if sample_every > 1:
+             sample_note = f"Preview over 1 in {sample_every} beneficiaries, as the full query is too expensive. "
            show_pop = 'False'
          else:
            show_pop = 'True'
-         # Fetch data once with the AI filter applied
-         all_states_data = fetch_data(sqlstmt=inpatient_claims_source)
+         # Fetch data once with the AI filter applied. A newer search of the
+         # session interrupts the query, and then its answer is left out.
+         try:
+           all_states_data = fetch_data(sqlstmt=inpatient_claims_source, session=session_id, click=llm_response["click"],
+                                       set_id=set_id, sample_every=sample_every)
+         except QueryInterrupted as e:
+           if e.reason == 'superseded':
+             raise PreventUpdate
+           return default_view(f"The query took longer than {query_timeout:g} seconds. Please use more specific search criteria. {franklin_sql}")
          filtered_data = all_states_data.copy()
          top_10_data = all_states_data.sort_values('Readmission Rate', ascending=False).head(10).copy()
 
@@ -376,15 +534,36 @@ def update_data(n_clicks,user_input):
          min_value = filtered_data['Readmission Rate'].min()
          max_value = filtered_data['Readmission Rate'].max()
          return (
-           create_choropleth_map(filtered_data),
+           create_choropleth_map(filtered_data, min_value, max_value),
            create_column_chart(top_10_data),
            [{"name": i, "id": i} for i in filtered_data.columns],
-           filtered_data.to_dict('records'),
+           None if claims_filter is None else store_source({
+               "claims_filter": claims_filter, "checked_sql": inpatient_claims_source,
+               "set_id": set_id, "sample_every": sample_every}),
+           0,
            show_pop == 'True',
-           f" {franklin_sql}"
+           f"{sample_note} {franklin_sql}"
          )
-    return no_update  
-    
+
+##Page of the state table, from the result cache when this process already
+##ran its query
+@app.callback(
+    Output('table', 'data'),
+    Output('table', 'page_count'),
+    Input('table-source', 'data'),
+    Input('table', 'page_current'),
+    Input('table', 'page_size'),
+    Input('table', 'sort_by'),
+    Input('table', 'filter_query')
+)
+def page_table(source_id, page_current, page_size, sort_by, filter_query):
+    try:
+        all_states_data = state_rates(source_id)
+    except (RejectedQuery, QueryInterrupted):
+        raise PreventUpdate
+    with db_pool.cursor() as cursor:
+        return fetch_page(cursor, all_states_data, page_current, page_size, sort_by, filter_query)
+
 ##Update SQL box
 @app.callback(
     Output("output-text", "style"),
@@ -405,28 +584,76 @@ def toggle_text(n_clicks,update_clicks,current_style):
 ##Update ICD Code Table
 @app.callback(
     Output("table-container", "style"),
-    Output("icd10-table", "data"), 
+    Output("icd10-source", "data"),
+    Output("icd10-table", "page_current"),
     Output("icd10-table", "style_table"),   
     Input("icd-code-btn", "n_clicks"),
     Input("update-btn", "n_clicks"),
     State("table-container", "style"),
     State("icd10-table", "style_table"),
+    State("llm-response", "data"),
     prevent_initial_call=True
 )
-def show_icd_tbl(toggle_clicks,update_clicks,current_style_cont,current_style_tbl):
+def show_icd_tbl(toggle_clicks,update_clicks,current_style_cont,current_style_tbl,llm_response):
    trigger_id = ctx.triggered_id
    if trigger_id == "update-btn":
       current_style_cont["display"] = "none" 
       current_style_tbl["height"] = "100px"
-      return [current_style_cont,noneicdcodedf.to_dict("records"),current_style_tbl]
+      return [current_style_cont,{"table": "none"},0,current_style_tbl]
    elif trigger_id == "icd-code-btn":
        current_style_cont["display"] = "block" if current_style_cont["display"] == "none" else "none" 
+       if llm_response is None or "msg" not in llm_response:
+           current_style_tbl["height"] = "100px"
+           return [current_style_cont,{"table": "error"},0,current_style_tbl]
+       franklin_sql, where_clause, icd_top_level_grp_cnt = parse_llm_sql(llm_response["msg"])
        if icd_top_level_grp_cnt < 10:
+           # The codes of the last answer, listed page by page. The code set
+           # is resolved once here, not for every page.
+           claims_filter = prefix_filters_to_ranges(franklin_sql, "ICD10_DGNS_CODE", "ICD10_DGNS_NUM")
+           try:
+               _, _, set_id = guard_sql(claims_filter)
+           except RejectedQuery:
+               current_style_tbl["height"] = "100px"
+               return [current_style_cont,{"table": "error"},0,current_style_tbl]
+           source_id = store_source({"claims_filter": claims_filter, "where_clause": where_clause,
+                                     "set_id": set_id, "click": llm_response["click"]})
            current_style_tbl["height"] = "400px"
-           return [current_style_cont,icdcodedf.to_dict("records"),current_style_tbl]
+           return [current_style_cont,{"source": source_id},0,current_style_tbl]
        else:
            current_style_tbl["height"] = "100px"
-           return [current_style_cont,errornoicdcodedf.to_dict("records"),current_style_tbl]
+           return [current_style_cont,{"table": "error"},0,current_style_tbl]
+
+##Page of the ICD Code Table
+@app.callback(
+    Output("icd10-table", "data"),
+    Output("icd10-table", "page_count"),
+    Input("icd10-source", "data"),
+    Input("icd10-table", "page_current"),
+    Input("icd10-table", "page_size"),
+    Input("icd10-table", "sort_by"),
+    Input("icd10-table", "filter_query"),
+    State("session-id", "data")
+)
+def page_icd_tbl(icd_source, page_current, page_size, sort_by, filter_query, session_id):
+    source = stored_source(icd_source.get("source")) if isinstance(icd_source, dict) else None
+    if source is None:
+        icdcodedf = no_codes_table() if icd_source == {"table": "none"} else errornoicdcodedf
+    else:
+        try:
+            # The codes of the code set show_icd_tbl resolved, or a query
+            # reusing the WHERE clause of the generated SQL, which fails when
+            # the clause isn't only about the codes (claims columns, ORDER BY,
+            # UNION, ...)
+            set_id = code_set_of(source["claims_filter"], source["set_id"])
+            icdcodedf = fetch_icd_codes(source["where_clause"], set_id, session_id, source["click"])
+        except (RejectedQuery, duckdb.Error):
+            icdcodedf = errornoicdcodedf
+        except QueryInterrupted as e:
+            if e.reason == 'superseded':
+                raise PreventUpdate
+            icdcodedf = errornoicdcodedf
+    with db_pool.cursor() as cursor:
+        return fetch_page(cursor, icdcodedf, page_current, page_size, sort_by, filter_query)
     
 # Add clientside callback for print functionality
 app.clientside_callback(
@@ -444,4 +671,7 @@ app.clientside_callback(
 )
 
 if __name__ == '__main__':
+    # The default view comes from the baseline snapshot, so the server starts
+    # right away; the ICD-10 description index is built alongside
+    threading.Thread(target=icd_index.get, name='icd-index', daemon=True).start()
     app.run_server(debug=True)
@@ -0,0 +1,193 @@
+# Single-pass readmission engine.
+# Claims are sorted once per beneficiary, and one pass over that order emits
+# the index admission, readmission and exclusion flags of every claim.
+# It reproduces the rows of the original readmission_rate query, which took a
+# LAG window over the 2008-2010 claims, LEFT JOINed the all_cause_readmission
+# view (a second LAG window, over claims with both dates), filtered
+# transplants with an IN subquery and aggregated with COUNT(DISTINCT).
+
+from claim_codes import rule_claims_query
+from clinical_rules import condition_rules
+from icd_procedures_import import procedure_cohorts, procedure_claims_query
+
+rate_years = (2008, 2009, 2010)
+
+# One row per claim row with its flags.
+# Both windows of the original queries ran over a subset of the claims:
+#  - index admissions: claims admitted in rate_years
+#  - readmissions: claims with an admission and a discharge date
+# Claims without an admission date sort last, so in admission order
+#  - the claims admitted in rate_years are consecutive, and the previous claim
+#    is in that subset if it was admitted in rate_years as well
+#  - the previous claim with both dates is the previous claim with a
+#    discharge date (LAG ... IGNORE NULLS)
+# which gives the flags from plain LAGs over a single sort. Claims admitted on
+# the same day are ordered by CLM_ID and SEGMENT, as in identify_readmissions.py,
+# so the flags don't depend on the order the rows are stored in.
+flagged_claims_query = f"""
+    WITH claims AS (
+        -- Exclusion flags were computed when the claims were loaded (see
+        -- clinical_rules.py), so the sort doesn't carry the diagnosis codes
+        SELECT
+            DESYNPUF_ID,
+            CLM_ID,
+            SEGMENT,
+            CLM_ADMSN_DT,
+            NCH_BENE_DSCHRG_DT,
+            COALESCE(NOT REHAB_FLAG AND NOT PSYCH_FLAG AND NOT AMA_FLAG, false) AS can_be_readmission,
+            COALESCE(TRANSPLANT_FLAG, false) AS is_planned_transplant
+        FROM inpatient_claims
+    ),
+    ordered_claims AS (
+        SELECT
+            *,
+            EXTRACT(YEAR FROM CLM_ADMSN_DT) AS year,
+            COALESCE(EXTRACT(YEAR FROM CLM_ADMSN_DT) IN {rate_years}, false) AS in_rate_years,
+            COALESCE(EXTRACT(YEAR FROM LAG(CLM_ADMSN_DT) OVER claim_order) IN {rate_years}, false) AS prev_in_rate_years,
+            LAG(NCH_BENE_DSCHRG_DT) OVER claim_order AS prev_discharge_date,
+            LAG(NCH_BENE_DSCHRG_DT IGNORE NULLS) OVER claim_order AS prev_stay_discharge_date
+        FROM claims
+        WINDOW claim_order AS (PARTITION BY DESYNPUF_ID ORDER BY CLM_ADMSN_DT NULLS LAST, CLM_ID, SEGMENT)
+    )
+    SELECT
+        DESYNPUF_ID,
+        CLM_ID,
+        CLM_ADMSN_DT,
+        NCH_BENE_DSCHRG_DT,
+        year,
+        in_rate_years AND (
+            NOT prev_in_rate_years
+            OR CLM_ADMSN_DT - prev_discharge_date > 30
+            OR prev_discharge_date IS NULL
+        ) AS is_index_admission,
+        can_be_readmission
+            AND CLM_ADMSN_DT IS NOT NULL AND NCH_BENE_DSCHRG_DT IS NOT NULL
+            AND COALESCE(
+                CLM_ADMSN_DT - prev_stay_discharge_date <= 30
+                AND CLM_ADMSN_DT <> prev_stay_discharge_date
+                , false) AS is_readmission,
+        is_planned_transplant
+    FROM ordered_claims
+"""
+
+# Age groups of the age_grp table (sql/age_grp.sql) as
+# (age_grp_id, lowest age, highest age) at admission
+age_groups = [
+    (1, 0, 12),
+    (2, 13, 19),
+    (3, 20, 39),
+    (4, 40, 59),
+    (5, 60, None),
+]
+
+age_group_case = 'CASE ' + ' '.join(
+    f"WHEN age <= {highest} THEN {age_grp_id}" if highest is not None else f"WHEN age >= {lowest} THEN {age_grp_id}"
+    for age_grp_id, lowest, highest in age_groups
+) + ' END'
+
+# Conditions matched through claim_codes: diagnosis cohorts by the rules of
+# clinical_rules.py, procedure cohorts by their ICD-10-PCS prefixes (see
+# icd_procedures_import.py). Transplants (99) are planned admissions, which
+# aren't index admissions, so they have no rows. Index admissions in none of
+# the cohorts are Other Conditions (100).
+procedure_conditions = {
+    55: 'Coronary Artery Bypass Graft (CABG) Surgery',
+    66: 'Total Hip Arthroplasty / Total Knee Arthroplasty (THA/TKA)',
+}
+other_condition_id = 100
+
+condition_claims_query = '\n    UNION\n    '.join(
+    [f"SELECT CLM_ID, {condition_type_id} AS condition_type_id FROM ({rule_claims_query(rule)})"
+     for condition_type_id, rule in condition_rules.items()] +
+    [f"SELECT CLM_ID, {condition_type_id} AS condition_type_id FROM ({procedure_claims_query(procedure_cohorts[cohort])})"
+     for condition_type_id, cohort in procedure_conditions.items()]
+)
+
+# The full readmission_rate cube in one grouped pass: every year, state and
+# sex by age group and condition, plus the roll-ups over all ages
+# (age_grp_id 0), all conditions (condition_type_id 0) and both.
+# Readmission and exclusion flags apply to a claim ID across all of its rows
+# (segments), like the original CLM_ID joins did. Each claim is counted once
+# per group, which is what the original COUNT(DISTINCT)s amounted to, so the
+# all-ages, all-conditions rows are the rows of the original query.
+# A claim can be in several conditions; the all-conditions rows only count
+# its first one. Admissions of beneficiaries without a birth date are only in
+# the all-ages rows.
+readmission_cube_query = f"""
+    WITH flagged_claims AS (
+        {flagged_claims_query}
+    ),
+    claim_flags AS (
+        SELECT
+            CLM_ID,
+            BOOL_OR(is_readmission) AS is_readmission,
+            BOOL_OR(is_planned_transplant) AS is_planned_transplant
+        FROM flagged_claims
+        GROUP BY CLM_ID
+    ),
+    bene_groups AS (
+        SELECT DISTINCT DESYNPUF_ID, SP_STATE_CODE, BENE_SEX_IDENT_CD
+        FROM beneficiary_summary
+    ),
+    bene_birth_dates AS (
+        SELECT DESYNPUF_ID, MIN(BENE_BIRTH_DT) AS BENE_BIRTH_DT
+        FROM beneficiary_summary
+        GROUP BY DESYNPUF_ID
+    ),
+    condition_claims AS (
+        SELECT
+            CLM_ID,
+            condition_type_id,
+            ROW_NUMBER() OVER (PARTITION BY CLM_ID ORDER BY condition_type_id) = 1 AS is_first_condition
+        FROM ({condition_claims_query})
+    ),
+    index_admissions AS (
+        SELECT
+            fc.year,
+            bg.SP_STATE_CODE,
+            bg.BENE_SEX_IDENT_CD,
+            fc.CLM_ID,
+            cf.is_readmission,
+            date_sub('year', bb.BENE_BIRTH_DT, fc.CLM_ADMSN_DT) AS age
+        FROM flagged_claims fc
+        JOIN claim_flags cf ON fc.CLM_ID = cf.CLM_ID
+        JOIN bene_groups bg ON fc.DESYNPUF_ID = bg.DESYNPUF_ID
+        LEFT JOIN bene_birth_dates bb ON fc.DESYNPUF_ID = bb.DESYNPUF_ID
+        WHERE fc.is_index_admission
+          AND NOT cf.is_planned_transplant
+    ),
+    grouped_admissions AS (
+        SELECT DISTINCT
+            ia.year,
+            ia.SP_STATE_CODE,
+            ia.BENE_SEX_IDENT_CD,
+            ia.CLM_ID,
+            ia.is_readmission,
+            {age_group_case} AS age_grp_id,
+            COALESCE(cc.condition_type_id, {other_condition_id}) AS condition_type_id,
+            COALESCE(cc.is_first_condition, true) AS is_first_condition
+        FROM index_admissions ia
+        LEFT JOIN condition_claims cc ON ia.CLM_ID = cc.CLM_ID
+    )
+    SELECT
+        year,
+        SP_STATE_CODE,
+        BENE_SEX_IDENT_CD,
+        CASE WHEN GROUPING(condition_type_id) = 1
+            THEN COUNT_IF(is_first_condition AND is_readmission)
+            ELSE COUNT_IF(is_readmission) END AS readmissions,
+        CASE WHEN GROUPING(condition_type_id) = 1
+            THEN COUNT_IF(is_first_condition)
+            ELSE COUNT(*) END AS total_admissions,
+        CASE WHEN GROUPING(age_grp_id) = 1 THEN 0 ELSE age_grp_id END AS age_grp_id,
+        CASE WHEN GROUPING(condition_type_id) = 1 THEN 0 ELSE condition_type_id END AS condition_type_id,
+        CAST(readmissions AS FLOAT) / total_admissions AS readmission_rate
+    FROM grouped_admissions
+    GROUP BY GROUPING SETS (
+        (year, SP_STATE_CODE, BENE_SEX_IDENT_CD, age_grp_id, condition_type_id),
+        (year, SP_STATE_CODE, BENE_SEX_IDENT_CD, age_grp_id),
+        (year, SP_STATE_CODE, BENE_SEX_IDENT_CD, condition_type_id),
+        (year, SP_STATE_CODE, BENE_SEX_IDENT_CD)
+    )
+    HAVING GROUPING(age_grp_id) = 1 OR age_grp_id IS NOT NULL
+"""
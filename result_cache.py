@@ -0,0 +1,68 @@
+import re
+import threading
+from collections import OrderedDict
+
+# In-memory result cache for the dashboard's queries.
+# Results are keyed by the normalized SQL text, its parameters and the data
+# version of the database, so a query the pipeline's data hasn't changed under
+# is answered from memory, and a reload makes every older entry unreachable
+# (they age out through the LRU order). The cache holds at most max_bytes of DataFrames and
+# evicts the least recently used ones beyond that.
+
+# A reload shows up as a newer timestamp in one of these tables
+data_version_query = """
+    SELECT
+        (SELECT MAX(finished_at) FROM pipeline_runs),
+        (SELECT MAX(loaded_at) FROM load_manifest),
+        (SELECT MAX(refreshed_at) FROM refresh_log)
+"""
+
+# String literals, which normalize_sql leaves as they are
+sql_literal_pattern = re.compile(r"('(?:[^']|'')*')")
+
+def normalize_sql(sql):
+    # Collapse whitespace and drop trailing semicolons outside string literals,
+    # so the same query typed or generated differently shares one entry
+    parts = sql_literal_pattern.split(sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i])
+    return ''.join(parts).strip().rstrip(';').strip()
+
+class ResultCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (sql, parameters, data version) -> (DataFrame, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def data_version(self, conn):
+        return conn.execute(data_version_query).fetchone()
+
+    def fetchdf(self, conn, sql, params=None):
+        # The result of sql with params bound as a DataFrame, from the cache
+        # if possible. The DataFrame is a copy, so callers may change it.
+        key = (normalize_sql(sql), tuple(params or ()), self.data_version(conn))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0].copy()
+            self.misses += 1
+
+        result = conn.execute(sql, params).fetchdf()
+        size = int(result.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            if size <= self.max_bytes and key not in self.entries:
+                self.entries[key] = (result, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.size -= evicted_size
+        return result.copy()
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
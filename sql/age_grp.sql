@@ -0,0 +1,13 @@
+CREATE TABLE if not exists age_grp (
+    age_grp_id INTEGER PRIMARY KEY,
+    age_grp_desc VARCHAR
+);
+
+INSERT OR IGNORE INTO age_grp (age_grp_id, age_grp_desc)
+VALUES
+(0, 'All ages'),
+(1, '12 or less'),
+(2, '13-19 years'),
+(3, '20-39 years'),
+(4, '40-59 years'),
+(5, '60+ years');
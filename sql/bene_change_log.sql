@@ -0,0 +1,5 @@
+CREATE TABLE if not exists bene_change_log (
+    table_name VARCHAR(50),
+    DESYNPUF_ID VARCHAR(16),
+    changed_at TIMESTAMP
+);
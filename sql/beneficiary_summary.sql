@@ -30,4 +30,7 @@ CREATE TABLE if not exists beneficiary_summary (
     PPPYMT_OP DECIMAL(13,2),
     MEDREIMB_CAR DECIMAL(13,2),
     BENRES_CAR DECIMAL(13,2),
-);
\ No newline at end of file
+);
+
+-- Source CSV file each row was loaded from (see load_manifest)
+ALTER TABLE beneficiary_summary ADD COLUMN IF NOT EXISTS SOURCE_FILE VARCHAR;
\ No newline at end of file
@@ -0,0 +1,8 @@
+CREATE TABLE if not exists claim_codes (
+    DESYNPUF_ID VARCHAR(16),
+    CLM_ID VARCHAR(20),
+    SEGMENT INTEGER,
+    code_type VARCHAR(10),  -- ICD9_DX, ICD9_PRCDR or HCPCS
+    position INTEGER,  -- n of the ICD9_DGNS_CD_n / ICD9_PRCDR_CD_n / HCPCS_CD_n column
+    code VARCHAR(7)
+);
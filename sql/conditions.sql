@@ -0,0 +1,18 @@
+CREATE TABLE if not exists conditions (
+    condition_type_id INTEGER PRIMARY KEY,
+    condition_type_nm VARCHAR
+);
+
+INSERT OR IGNORE INTO conditions (condition_type_id, condition_type_nm)
+VALUES
+(0, 'All conditions'),
+(11, 'Acute Myocardial Infarction (AMI)'),
+(22, 'Chronic Obstructive Pulmonary Disease (COPD)'),
+(33, 'Heart Failure (HF)'),
+(44, 'Pneumonia'),
+(55, 'Coronary Artery Bypass Graft (CABG) Surgery'),
+(66, 'Total Hip Arthroplasty / Total Knee Arthroplasty (THA/TKA)'),
+(77, 'Sepsis'),
+(88, 'Chronic Kidney Disease / ESRD'),
+(99, 'Transplants'),
+(100, 'Other Conditions');
@@ -80,4 +80,13 @@ CREATE TABLE if not exists inpatient_claims (
     HCPCS_CD_43 VARCHAR(5),
     HCPCS_CD_44 VARCHAR(5),
     HCPCS_CD_45 VARCHAR(5)
-);
\ No newline at end of file
+);
+
+-- Source CSV file each row was loaded from (see load_manifest)
+ALTER TABLE inpatient_claims ADD COLUMN IF NOT EXISTS SOURCE_FILE VARCHAR;
+
+-- Clinical exclusion flags, computed at load time from the rules in clinical_rules.py
+ALTER TABLE inpatient_claims ADD COLUMN IF NOT EXISTS PSYCH_FLAG BOOLEAN;
+ALTER TABLE inpatient_claims ADD COLUMN IF NOT EXISTS REHAB_FLAG BOOLEAN;
+ALTER TABLE inpatient_claims ADD COLUMN IF NOT EXISTS AMA_FLAG BOOLEAN;
+ALTER TABLE inpatient_claims ADD COLUMN IF NOT EXISTS TRANSPLANT_FLAG BOOLEAN;
\ No newline at end of file
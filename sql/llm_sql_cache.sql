@@ -0,0 +1,9 @@
+CREATE TABLE if not exists llm_sql_cache (
+    question VARCHAR,
+    prompt_version VARCHAR(64),
+    model VARCHAR(50),
+    response VARCHAR,
+    created_at TIMESTAMP,
+    last_used_at TIMESTAMP,
+    PRIMARY KEY (question, prompt_version, model)
+);
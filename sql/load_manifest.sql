@@ -0,0 +1,9 @@
+CREATE TABLE if not exists load_manifest (
+    table_name VARCHAR(50),
+    source_file VARCHAR,
+    file_size BIGINT,
+    checksum VARCHAR(8),
+    row_count BIGINT,
+    loaded_at TIMESTAMP,
+    PRIMARY KEY (table_name, source_file)
+);
\ No newline at end of file
@@ -0,0 +1,7 @@
+CREATE TABLE if not exists pipeline_runs (
+    stage VARCHAR(50),
+    fingerprint VARCHAR(64),
+    finished_at TIMESTAMP,
+    seconds DOUBLE,
+    PRIMARY KEY (stage)
+);
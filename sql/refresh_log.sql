@@ -0,0 +1,6 @@
+CREATE TABLE if not exists refresh_log (
+    target VARCHAR(50),
+    refreshed_through TIMESTAMP,
+    refreshed_at TIMESTAMP,
+    PRIMARY KEY (target)
+);
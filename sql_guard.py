@@ -0,0 +1,90 @@
+import json
+import math
+
+import duckdb
+
+# Checks of the LLM-generated SQL before the dashboard runs it.
+# The statement is parsed by DuckDB itself (json_serialize_sql, which only
+# accepts SELECT statements): it has to be a single SELECT that reads nothing
+# but the allowed tables, so no table functions (read_csv, ...), no other
+# tables and no second statement. Its cost is then estimated from the plan
+# of EXPLAIN, as the sum of the estimated rows of every operator. A query
+# over max_cost is run as a preview over a sample of the beneficiaries, one
+# in sample_every of them, small enough to stay under max_cost; one that
+# would need a sample smaller than one in max_sample_every is rejected.
+
+class RejectedQuery(ValueError):
+    pass
+
+def sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+def find_nodes(tree, node_types):
+    # Every node of a parsed statement whose type is one of node_types
+    if isinstance(tree, dict):
+        if tree.get('type') in node_types:
+            yield tree
+        for value in tree.values():
+            yield from find_nodes(value, node_types)
+    elif isinstance(tree, list):
+        for value in tree:
+            yield from find_nodes(value, node_types)
+
+def parse_select(conn, sql):
+    # Syntax tree of a SELECT statement, as DuckDB's JSON serialization
+    return json.loads(conn.execute(f"SELECT json_serialize_sql({sql_literal(sql)})").fetchone()[0])
+
+def validate_select(conn, sql, allowed_tables):
+    # Raises RejectedQuery unless sql is one SELECT over allowed_tables
+    parsed = parse_select(conn, sql)
+    if parsed['error']:
+        raise RejectedQuery(f"The SQL is not a single SELECT statement: {parsed['error_message']}")
+    if len(parsed['statements']) != 1:
+        raise RejectedQuery("The SQL is not a single SELECT statement")
+    if any(True for _ in find_nodes(parsed, ('TABLE_FUNCTION',))):
+        raise RejectedQuery("Table functions are not allowed")
+    # Common table expressions are referenced like tables
+    cte_names = {cte['key'].lower() for node in find_nodes(parsed, ('SELECT_NODE', 'SET_OPERATION_NODE'))
+                 for cte in node.get('cte_map', {}).get('map', [])}
+    allowed = {table.lower() for table in allowed_tables}
+    for table in find_nodes(parsed, ('BASE_TABLE',)):
+        name = table['table_name'].lower()
+        qualified_name = '.'.join(part for part in (table['catalog_name'], table['schema_name'], table['table_name']) if part)
+        if table['catalog_name'] or table['schema_name'].lower() not in ('', 'main'):
+            raise RejectedQuery(f"Table {qualified_name} is not allowed")
+        if name not in allowed and name not in cte_names:
+            raise RejectedQuery(f"Table {qualified_name} is not allowed")
+
+def plan_estimates(conn, sql):
+    # Estimated rows of the result, and summed over every operator of the plan
+    plan = json.loads(conn.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()[0][1])
+
+    def operator_rows(node):
+        return int(node.get('extra_info', {}).get('Estimated Cardinality', 0) or 0)
+
+    def total_rows(node):
+        return operator_rows(node) + sum(total_rows(child) for child in node['children'])
+
+    return operator_rows(plan[0]), sum(total_rows(node) for node in plan)
+
+def guard_generated_sql(conn, sql, allowed_tables, max_cost, max_sample_every=100):
+    # The SQL to run instead of sql, and one in how many beneficiaries it covers
+    validate_select(conn, sql, allowed_tables)
+    try:
+        rows, cost = plan_estimates(conn, sql)
+    except duckdb.Error as e:
+        # e.g. a column that doesn't exist
+        raise RejectedQuery(str(e).splitlines()[0]) from None
+    if cost <= max_cost:
+        return sql, 1
+    sample_every = math.ceil(cost / max_cost)
+    if sample_every > max_sample_every:
+        raise RejectedQuery(f"The query is too expensive (about {rows:,} claims, estimated cost {cost:,})")
+    return sample_beneficiaries(sql, sample_every), sample_every
+
+def sample_beneficiaries(sql, sample_every):
+    # The claims of one in sample_every beneficiaries. Sampling whole
+    # beneficiaries keeps their readmissions intact.
+    if sample_every == 1:
+        return sql
+    return f"SELECT * FROM ({sql}) AS s WHERE hash(s.DESYNPUF_ID) % {sample_every} = 0"
@@ -0,0 +1,86 @@
+import json
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the LLM endpoint, for trying the dashboard without an
+# API key. It answers the OpenAI-compatible /v1/chat/completions requests of
+# plotly_dashboard_ai.py with SQL for a few known conditions, after an
+# artificial delay like a real model's, and counts the requests it served.
+#
+#   python stub_llm_server.py [port] [delay seconds]
+#   LLM_API_URL=http://localhost:8001 LLM_API_KEY=stub python plotly_dashboard_ai.py
+
+# Condition keyword -> ICD-10 code prefixes
+condition_prefixes = {
+    'heart failure': ['I50', 'I110', 'I130', 'I132'],
+    'heart attack': ['I21', 'I22'],
+    'myocardial infarction': ['I21', 'I22'],
+    'copd': ['J44'],
+    'pneumonia': ['J12', 'J13', 'J14', 'J15', 'J16', 'J17', 'J18'],
+    'sepsis': ['A40', 'A41'],
+    'diabetes': ['E08', 'E09', 'E10', 'E11', 'E13'],
+    'kidney': ['N18', 'N19'],
+}
+
+request_count = 0
+
+def question_of(prompt):
+    # The user's question sits between the schema part and the requirements
+    match = re.search(r"The user's question is:\s*(.*?)\s*Please generate", prompt, re.DOTALL)
+    return match.group(1) if match else prompt
+
+def answer(question):
+    prefixes = []
+    for keyword, keyword_prefixes in condition_prefixes.items():
+        if keyword in question.lower():
+            prefixes.extend(keyword_prefixes)
+    if not prefixes:
+        prefixes = ['NONE']
+    conditions = ' OR '.join(f"ICD10_DGNS_CODE LIKE '{prefix}%'" for prefix in prefixes)
+    return f"$$$\nSELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE {conditions}\n$$$"
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+
+    def do_POST(self):
+        global request_count
+        if self.path != '/v1/chat/completions':
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        time.sleep(self.server.delay)
+        request_count += 1
+        content = answer(question_of(body['messages'][-1]['content']))
+        print(f"Request {request_count}: {content.splitlines()[1]}", flush=True)
+        payload = json.dumps({
+            'id': f'stub-{request_count}',
+            'object': 'chat.completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=2.0):
+        super().__init__(address, StubHandler)
+        self.delay = delay  # seconds before each answer
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    server = StubServer(('localhost', port), delay=float(sys.argv[2]) if len(sys.argv) > 2 else 2.0)
+    print(f"Stub LLM server on http://localhost:{port} with a {server.delay}s delay")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {request_count} requests.")
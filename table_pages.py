@@ -0,0 +1,107 @@
+import math
+import re
+
+import pandas as pd
+
+# Server-side paging of the dashboard's tables (DataTable page_action,
+# sort_action and filter_action "custom").
+# A table's rows stay on the server, as the DataFrame of its query in the
+# result cache. For every page the DataFrame is registered with a DuckDB
+# cursor and the table's filter and sort are run over it as SQL, with LIMIT and
+# OFFSET, so the browser only ever receives the rows of the page it shows.
+# filter_query is the DataTable's filter expression, e.g.
+#   {State} contains "C" && {Readmission Rate} > 0.1
+# Its parts are translated to SQL conditions, with the values as parameters;
+# parts that don't parse, or name a column the table doesn't have, are left out.
+
+# Name the DataFrame is registered under
+page_view = 'table_page_data'
+
+# Filter operators of the DataTable -> SQL comparison
+comparisons = {
+    '>=': '>=', 'ge': '>=',
+    '<=': '<=', 'le': '<=',
+    '<': '<', 'lt': '<',
+    '>': '>', 'gt': '>',
+    '!=': '<>', 'ne': '<>',
+    '=': '=', 'eq': '=',
+}
+
+# One part of a filter expression: {column} operator value. Operators may have
+# an i (case-insensitive) or s (case-sensitive) prefix.
+filter_part_pattern = re.compile(
+    r"^\s*\{(?P<column>[^}]+)\}\s*(?P<case>[is]?)(?P<operator>>=|<=|!=|<|>|=|ge|le|lt|gt|ne|eq|contains|datestartswith)"
+    r"\s+(?P<value>.+?)\s*$",
+    re.DOTALL,
+)
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def filter_value(text):
+    # The value of a filter part: quoted text, or a number when it reads as one
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in ('"', "'", '`'):
+        return text[1:-1].replace('\\' + text[0], text[0])
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def filter_conditions(filter_query, data):
+    # SQL conditions of a DataTable filter expression over the columns of
+    # data, and their parameters
+    conditions, params = [], []
+    for part in (filter_query or '').split(' && '):
+        match = filter_part_pattern.match(part)
+        if match is None or match.group('column') not in data.columns:
+            continue
+        column = quote_identifier(match.group('column'))
+        operator = match.group('operator')
+        value = filter_value(match.group('value'))
+        # The value as typed, for text comparisons
+        text = match.group('value') if isinstance(value, float) else value
+        numeric = pd.api.types.is_numeric_dtype(data[match.group('column')])
+        if operator == 'contains':
+            if match.group('case') == 'i':
+                conditions.append(f"contains(lower(CAST({column} AS VARCHAR)), lower(?))")
+            else:
+                conditions.append(f"contains(CAST({column} AS VARCHAR), ?)")
+            params.append(text)
+        elif operator == 'datestartswith':
+            conditions.append(f"starts_with(CAST({column} AS VARCHAR), ?)")
+            params.append(text)
+        elif numeric and isinstance(value, float):
+            conditions.append(f"{column} {comparisons[operator]} ?")
+            params.append(value)
+        elif numeric:
+            # Text compared with a number column matches no row
+            conditions.append("false")
+        else:
+            if match.group('case') == 'i':
+                conditions.append(f"lower(CAST({column} AS VARCHAR)) {comparisons[operator]} lower(?)")
+            else:
+                conditions.append(f"CAST({column} AS VARCHAR) {comparisons[operator]} ?")
+            params.append(text)
+    return conditions, params
+
+def order_by(sort_by, data):
+    # ORDER BY clause of a DataTable sort_by over the columns of data
+    terms = [f"{quote_identifier(sort['column_id'])} {'DESC' if sort['direction'] == 'desc' else 'ASC'}"
+             for sort in sort_by or [] if sort['column_id'] in data.columns]
+    return f"ORDER BY {', '.join(terms)}" if terms else ""
+
+def fetch_page(conn, data, page_current, page_size, sort_by=None, filter_query=None):
+    # The rows of one page of data, filtered and sorted as the DataTable asks,
+    # as records, and the number of pages
+    conditions, params = filter_conditions(filter_query, data)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn.register(page_view, data)
+    try:
+        rows = conn.execute(f"SELECT count(*) FROM {page_view} {where}", params).fetchone()[0]
+        page = conn.execute(
+            f"SELECT * FROM {page_view} {where} {order_by(sort_by, data)} LIMIT ? OFFSET ?",
+            params + [page_size, (page_current or 0) * page_size],
+        ).fetchdf()
+    finally:
+        conn.unregister(page_view)
+    return page.to_dict('records'), max(1, math.ceil(rows / page_size))
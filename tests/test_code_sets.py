@@ -0,0 +1,49 @@
+import duckdb
+import pytest
+
+from code_sets import CodeSets
+from icd10_hierarchy import code_number, prefix_filters_to_ranges
+
+hierarchy_codes = ['I10', 'I210', 'I214', 'I509', 'J441', 'E119', 'N189']
+# NoDx isn't an ICD-10-CM code, and some claims have no code at all
+claim_codes = ['I10', 'I210', 'I210', 'I509', 'J441', 'E119', 'NoDx', 'NoDx', None]
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE icd10_hierarchy (icd10_cm_code VARCHAR, code_num BIGINT, description VARCHAR)")
+    conn.executemany("INSERT INTO icd10_hierarchy VALUES (?, ?, ?)",
+                     [[code, code_number(code), f"Description of {code}"] for code in hierarchy_codes])
+    conn.execute("CREATE TABLE INPATIENT_CLAIMS_ICD10 (CLM_ID VARCHAR, ICD10_DGNS_CODE VARCHAR, ICD10_DGNS_NUM BIGINT)")
+    # NoDx gets a number the way the import computes it, with 0 for lowercase characters
+    conn.executemany("INSERT INTO INPATIENT_CLAIMS_ICD10 VALUES (?, ?, ?)",
+                     [[f"C{i}", code, None if code is None else code_number(code.upper())]
+                      for i, code in enumerate(claim_codes)])
+    yield conn
+    conn.close()
+
+@pytest.mark.parametrize('where', [
+    "ICD10_DGNS_CODE LIKE 'I%'",
+    "ICD10_DGNS_CODE LIKE 'I21%' OR ICD10_DGNS_CODE LIKE 'J44%'",
+    "ICD10_DGNS_CODE NOT LIKE 'I%'",
+    "ICD10_DGNS_CODE = 'NoDx'",
+    "ICD10_DGNS_CODE = 'I10'",
+    "ICD10_DGNS_CODE <> 'I10'",
+])
+def test_code_set_matches_direct_query(conn, where):
+    code_sets = CodeSets("INPATIENT_CLAIMS_ICD10")
+    code_sets.attach(conn)
+    for sql in (f"SELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE {where}",
+                prefix_filters_to_ranges(f"SELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE {where}",
+                                         "ICD10_DGNS_CODE", "ICD10_DGNS_NUM")):
+        set_id = code_sets.resolve(conn, sql, data_version=1)
+        assert set_id is not None
+        direct = sorted(conn.execute(f"SELECT CLM_ID FROM ({sql})").fetchall())
+        through_set = sorted(conn.execute(f"SELECT CLM_ID FROM ({code_sets.claims_query(set_id)})").fetchall())
+        assert through_set == direct
+
+def test_other_columns_are_not_code_filters(conn):
+    code_sets = CodeSets("INPATIENT_CLAIMS_ICD10")
+    code_sets.attach(conn)
+    assert code_sets.resolve(conn, "SELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE CLM_ID = 'C1'", 1) is None
+    assert code_sets.resolve(conn, "SELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE ICD10_DGNS_CODE IS NULL", 1) is None
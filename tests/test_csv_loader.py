@@ -0,0 +1,48 @@
+import datetime
+import zipfile
+
+import duckdb
+import pytest
+
+from csv_loader import ddl_column_types, load_csv_files, load_zip
+
+ddl_path = 'sql/beneficiary_summary.sql'
+
+@pytest.fixture
+def conn(monkeypatch):
+    # The DDL files are read relative to the repository root
+    monkeypatch.chdir(__file__.rsplit('/tests/', 1)[0])
+    conn = duckdb.connect()
+    for path in (ddl_path, 'sql/load_manifest.sql', 'sql/bene_change_log.sql'):
+        with open(path) as file:
+            conn.execute(file.read())
+    yield conn
+    conn.close()
+
+def beneficiary_csv(path):
+    # A SynPUF beneficiary file: the table's columns, with PPPYMT_CAR between
+    # them as in the real files
+    columns = list(ddl_column_types(ddl_path)) + ['PPPYMT_CAR']
+    values = {'DESYNPUF_ID': ['00013D2EFD8E45D1', '00016F745862898F'], 'BENE_BIRTH_DT': ['19230501', '19430101'],
+              'BENE_DEATH_DT': ['', ''], 'PPPYMT_CAR': ['30.00', '40.00']}
+    with open(path, 'w') as file:
+        file.write(','.join(columns) + '\n')
+        for i in range(2):
+            file.write(','.join(values[name][i] if name in values else '1' for name in columns) + '\n')
+
+def test_load_csv_files_drops_extra_columns(conn, tmp_path):
+    path = tmp_path / 'beneficiary_summary_2008.csv'
+    beneficiary_csv(path)
+    assert load_csv_files(conn, [str(path)], 'beneficiary_summary', ddl_column_types(ddl_path)) == 2
+    assert conn.execute("SELECT DESYNPUF_ID, BENE_BIRTH_DT, SOURCE_FILE FROM beneficiary_summary ORDER BY 1").fetchone() == (
+        '00013D2EFD8E45D1', datetime.date(1923, 5, 1), 'beneficiary_summary_2008.csv')
+
+def test_load_zip_drops_extra_columns(conn, tmp_path):
+    path = tmp_path / 'beneficiary_summary_2008.csv'
+    beneficiary_csv(path)
+    zip_path = tmp_path / 'bene.zip'
+    with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+        zip_ref.write(path, path.name)
+    assert load_zip(conn, str(zip_path), 'beneficiary_summary', ddl_column_types(ddl_path)) == 2
+    assert conn.execute("SELECT DESYNPUF_ID, BENE_BIRTH_DT FROM beneficiary_summary ORDER BY 1").fetchone() == (
+        '00013D2EFD8E45D1', datetime.date(1923, 5, 1))
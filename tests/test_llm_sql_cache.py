@@ -0,0 +1,81 @@
+import threading
+
+import duckdb
+import pytest
+
+import stub_llm_server
+from llm_client import llm_session, chat_completion
+from llm_sql_cache import LlmSqlCache, prompt_version
+from stub_llm_server import StubServer
+
+version = prompt_version("Here is the DDL ...", "Please generate a DuckDB-compatible SQL query")
+
+@pytest.fixture
+def stub():
+    server = StubServer(('localhost', 0), delay=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def cache_path(monkeypatch, tmp_path):
+    # The DDL file is read relative to the repository root
+    monkeypatch.chdir(__file__.rsplit('/tests/', 1)[0])
+    return str(tmp_path / 'llm_cache.duckdb')
+
+def ask(cache, server, question, version=version, model="franklin"):
+    # What the dashboard's generate_sql does: the cached answer, or the LLM's,
+    # which is then cached
+    msg = cache.get(question, version, model)
+    if msg is None:
+        url = f"http://localhost:{server.server_address[1]}/v1/chat/completions"
+        content = f"Here is the DDL ... The user's question is: {question} Please generate a DuckDB-compatible SQL query"
+        data = {"model": model, "messages": [{"role": "user", "content": content}]}
+        msg = chat_completion(llm_session(retries=0, pool_size=1), url, {"Content-Type": "application/json"},
+                              data, 5, 5)
+        cache.put(question, version, model, msg)
+    return msg
+
+def requests_made(server, cache, questions, **kwargs):
+    # Number of requests the stub received while the questions were asked
+    start = stub_llm_server.request_count
+    for question in questions:
+        ask(cache, server, question, **kwargs)
+    return stub_llm_server.request_count - start
+
+def test_repeated_question_is_served_from_cache(stub, cache_path):
+    cache = LlmSqlCache(cache_path, ttl_hours=24, max_entries=10)
+    first = ask(cache, stub, "Readmissions for heart failure")
+    assert requests_made(stub, cache, ["Readmissions for heart failure"]) == 0
+    assert ask(cache, stub, "Readmissions for heart failure") == first
+
+def test_case_and_whitespace_share_an_entry(stub, cache_path):
+    cache = LlmSqlCache(cache_path, ttl_hours=24, max_entries=10)
+    assert requests_made(stub, cache, ["Readmissions for COPD", "  readmissions   FOR copd\n",
+                                       "READMISSIONS\tfor Copd"]) == 1
+
+def test_keyed_on_prompt_version_and_model(stub, cache_path):
+    cache = LlmSqlCache(cache_path, ttl_hours=24, max_entries=10)
+    assert requests_made(stub, cache, ["copd"]) == 1
+    assert requests_made(stub, cache, ["copd"], version=prompt_version("An edited prompt")) == 1
+    assert requests_made(stub, cache, ["copd"], model="another-model") == 1
+    assert requests_made(stub, cache, ["copd"]) == 0
+
+def test_expired_entries_are_asked_again(stub, cache_path):
+    cache = LlmSqlCache(cache_path, ttl_hours=1, max_entries=10)
+    assert requests_made(stub, cache, ["pneumonia", "sepsis"]) == 2
+    conn = duckdb.connect(cache_path)
+    conn.execute("UPDATE llm_sql_cache SET created_at = created_at - INTERVAL 2 HOUR WHERE question = 'pneumonia'")
+    conn.close()
+    assert requests_made(stub, cache, ["pneumonia"]) == 1
+    assert requests_made(stub, cache, ["sepsis"]) == 0
+
+def test_least_recently_used_entries_are_evicted(stub, cache_path):
+    cache = LlmSqlCache(cache_path, ttl_hours=24, max_entries=2)
+    assert requests_made(stub, cache, ["pneumonia", "sepsis"]) == 2
+    # pneumonia was used last, so sepsis makes room for the third question
+    assert requests_made(stub, cache, ["pneumonia", "copd"]) == 1
+    assert requests_made(stub, cache, ["pneumonia", "copd"]) == 0
+    assert requests_made(stub, cache, ["sepsis"]) == 1
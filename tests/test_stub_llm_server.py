@@ -0,0 +1,41 @@
+import threading
+import time
+
+import pytest
+
+from llm_client import llm_session, chat_completion
+from stub_llm_server import StubServer
+
+def prompt(question):
+    # The question between the parts of the dashboard's prompt, as the stub expects it
+    return f"Here is the DDL ... The user's question is: {question} Please generate a DuckDB-compatible SQL query"
+
+@pytest.fixture
+def stub():
+    server = StubServer(('localhost', 0), delay=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def ask(server, question, read_timeout=5):
+    url = f"http://localhost:{server.server_address[1]}/v1/chat/completions"
+    data = {"model": "franklin", "messages": [{"role": "user", "content": prompt(question)}]}
+    return chat_completion(llm_session(retries=0, pool_size=1), url, {"Content-Type": "application/json"},
+                           data, 5, read_timeout)
+
+def test_answers_known_conditions(stub):
+    assert ask(stub, "Readmissions for heart failure") == (
+        "$$$\nSELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE ICD10_DGNS_CODE LIKE 'I50%' OR "
+        "ICD10_DGNS_CODE LIKE 'I110%' OR ICD10_DGNS_CODE LIKE 'I130%' OR ICD10_DGNS_CODE LIKE 'I132%'\n$$$")
+
+def test_unknown_condition_matches_no_code(stub):
+    assert ask(stub, "Readmissions for a broken toe") == (
+        "$$$\nSELECT * FROM INPATIENT_CLAIMS_ICD10 as c WHERE ICD10_DGNS_CODE LIKE 'NONE%'\n$$$")
+
+def test_delay_is_per_server(stub):
+    stub.delay = 0.3
+    start = time.monotonic()
+    ask(stub, "copd")
+    assert time.monotonic() - start >= 0.3